@@ -1,8 +1,12 @@
 # This is a simple "port" of PIL.ImageQt to PyQt5
 from PIL import Image
-from PIL._util import isPath
+try:
+    from PIL._util import isPath
+except ImportError:
+    # renamed in newer Pillow versions
+    from PIL._util import is_path as isPath
 
-from PyQt5.QtGui import QImage, qRgb
+from PyQt5.QtGui import QImage, QPixmap, qRgb
 
 ##
 # (Internal) Turns an RGB color into a Qt compatible color integer.
@@ -16,13 +20,17 @@ def rgb(r, g, b):
 # An PIL image wrapper for Qt.  This is a subclass of PyQt5's QImage
 # class.
 #
+# The pixel data is exported once in the byte order of the chosen Qt
+# format (no per pixel swizzling on the PIL side) and the QImage is
+# constructed directly over that buffer with explicit bytes per line,
+# so Qt doesn't copy it again. The buffer lives as long as this object.
+#
 # @param im A PIL Image object, or a file name (given either as Python
 #     string or a PyQt string object).
 
 class ImageQt(QImage):
     def __init__(self, im):
 
-        data = None
         colortable = None
 
         # handle filename, if given instead of image name
@@ -32,37 +40,46 @@ class ImageQt(QImage):
         if isPath(im):
             im = Image.open(im)
 
+        width, height = im.size
+
         if im.mode == "1":
+            data = im.tobytes("raw", "1")
+            bytes_per_line = (width + 7) // 8
             format = QImage.Format_Mono
         elif im.mode == "L":
-            format = QImage.Format_Indexed8
-            colortable = []
-            for i in range(256):
-                colortable.append(rgb(i, i, i))
+            data = im.tobytes("raw", "L")
+            bytes_per_line = width
+            format = QImage.Format_Grayscale8
         elif im.mode == "P":
+            data = im.tobytes("raw", "P")
+            bytes_per_line = width
             format = QImage.Format_Indexed8
             colortable = []
             palette = im.getpalette()
             for i in range(0, len(palette), 3):
                 colortable.append(rgb(*palette[i:i+3]))
         elif im.mode == "RGB":
-            data = im.tobytes("raw", "BGRX")
-            format = QImage.Format_RGB32
+            data = im.tobytes("raw", "RGBX")
+            bytes_per_line = width * 4
+            format = QImage.Format_RGBX8888
         elif im.mode == "RGBA":
-            try:
-                data = im.tobytes("raw", "BGRA")
-            except SystemError:
-                # workaround for earlier versions
-                r, g, b, a = im.split()
-                im = Image.merge("RGBA", (b, g, r, a))
-            format = QImage.Format_ARGB32
+            data = im.tobytes("raw", "RGBA")
+            bytes_per_line = width * 4
+            format = QImage.Format_RGBA8888
         else:
             raise ValueError("unsupported image mode %r" % im.mode)
 
         # must keep a reference, or Qt will crash!
-        self.__data = data or im.tobytes()
+        self.__data = data
 
-        QImage.__init__(self, self.__data, im.size[0], im.size[1], format)
+        QImage.__init__(self, self.__data, width, height, bytes_per_line, format)
 
         if colortable:
             self.setColorTable(colortable)
+
+##
+# Converts a PIL image to a QPixmap.  QPixmap.fromImage copies the
+# pixels, so the intermediate ImageQt can be released right away.
+
+def toQPixmap(im):
+    return QPixmap.fromImage(ImageQt(im))
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+
+from PyMangaLogger import log
+
+def imageBytes(image):
+    """ memory footprint of a decoded PIL.Image (width * height * channels) """
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+def pixmapBytes(pixmap):
+    """ memory footprint of a QPixmap (32 bit per pixel) """
+    return pixmap.width() * pixmap.height() * 4
+
+class PageCache(object):
+    """
+    Thread safe LRU cache for decoded pages with a memory budget in bytes
+    The least recently used pages are evicted until the budget is met again
+    sizeof returns the bytes of a cached value, PIL.Images by default
+    """
+    budget  = 0     # max. bytes of all cached images, 0 disables the cache
+    used    = 0     # bytes of all cached images
+    entries = None  # key -> (image, bytes), oldest first
+
+    def __init__(self, budget = 0, sizeof = imageBytes):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.sizeof = sizeof
+        self.setBudget(budget)
+
+    def setBudget(self, budget):
+        with self.lock:
+            self.budget = max(0, budget)
+            self.evict()
+
+    def get(self, key):
+        """ returns the cached image for key or None """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, image):
+        size = self.sizeof(image)
+        with self.lock:
+            if size > self.budget:
+                return
+
+            old = self.entries.pop(key, None)
+            if old:
+                self.used -= old[1]
+
+            self.entries[key] = (image, size)
+            self.used += size
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used = 0
+
+    def evict(self):
+        """ drop least recently used entries until the budget fits, needs the lock """
+        while self.used > self.budget and self.entries:
+            key, (image, size) = self.entries.popitem(last=False)
+            self.used -= size
+            log.debug("Page cache: evicted %s (%d bytes)", key, size)
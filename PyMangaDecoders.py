@@ -0,0 +1,275 @@
+import io
+import os
+import json
+import math
+import time
+
+from PIL import Image
+
+from PyMangaLogger import log
+from PyMangaTiming import timed
+
+# image file extensions the library lists as pages -> format they usually hold
+image_extensions = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".gif": "gif", ".webp": "webp", ".bmp": "bmp"}
+
+# formats the decoders are chosen for, the sniffed format of a page decides, not its extension
+image_formats = ["jpeg", "png", "gif", "webp", "bmp"]
+
+def sniffFormat(head):
+    """ format of the image starting with the bytes head (at least 12), None if it isn't known """
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:2] == b"BM":
+        return "bmp"
+    return None
+
+def readHead(file, count = 16):
+    """ the first count bytes of file (path or seekable bytestream, its position is kept) """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return f.read(count)
+    position = file.tell()
+    try:
+        return file.read(count)
+    finally:
+        file.seek(position)
+
+def readBytes(file):
+    """ the content of file (path or bytestream from its current position) """
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            return f.read()
+    return file.read()
+
+def reducedDecodeSize(image_size, size):
+    """
+    smallest size the image can be decoded at to still cover size after fitting it in there
+    returns None if the image is not larger than size
+    """
+    width, height = image_size
+    ratio = min(size[0]/width, size[1]/height)
+    if ratio >= 1:
+        return None
+    return (max(int(math.ceil(width*ratio)), 1), max(int(math.ceil(height*ratio)), 1))
+
+def reduceImage(image, needed):
+    """ box-reduce image by the largest integer factor that still covers needed """
+    factor = min(image.size[0] // needed[0], image.size[1] // needed[1])
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
+
+class PilDecoder(object):
+    """
+    Decodes with PIL, reads every format PIL knows (also the ones no other decoder handles)
+    JPEGs are decoded in draft mode (scaled DCT, 1/2, 1/4 or 1/8 of the size),
+    other formats are box-reduced by an integer factor afterwards
+    """
+    name = "pil"
+    formats = None # any
+
+    def available(self):
+        return True
+
+    def supports(self, format):
+        return True
+
+    def decode(self, file, format, size):
+        with timed("decode"):
+            image = Image.open(file)
+            original_size = image.size
+
+            needed = reducedDecodeSize(original_size, size) if size else None
+            if needed and image.format == "JPEG":
+                image.draft("RGB", needed)
+            image.load()
+
+        with timed("convert"):
+            image = image.convert("RGB")
+            if needed:
+                image = reduceImage(image, needed)
+
+        image.info["original_size"] = original_size
+        return image
+
+class TurboJpegDecoder(object):
+    """
+    Decodes JPEGs with libjpeg-turbo through the optional PyTurboJPEG binding (turbojpeg module)
+    Scaled while decoding by the smallest of the libjpeg-turbo scaling factors that still covers the size
+    """
+    name = "turbojpeg"
+    formats = set(["jpeg"])
+    turbo = None # TurboJPEG instance, False if the binding or the library isn't there
+
+    def available(self):
+        if self.turbo is None:
+            try:
+                from turbojpeg import TurboJPEG
+                self.turbo = TurboJPEG()
+            except Exception as ex:
+                log.info("libjpeg-turbo binding not available: %s", ex)
+                self.turbo = False
+        return bool(self.turbo)
+
+    def supports(self, format):
+        return format in self.formats and self.available()
+
+    def decode(self, file, format, size):
+        from turbojpeg import TJPF_RGB
+
+        with timed("decode"):
+            data = readBytes(file)
+            width, height = self.turbo.decode_header(data)[:2]
+            original_size = (width, height)
+
+            scale = None
+            needed = reducedDecodeSize(original_size, size) if size else None
+            if needed:
+                fitting = [(num, den) for num, den in self.turbo.scaling_factors
+                           if num <= den and math.ceil(width * num / den) >= needed[0] and math.ceil(height * num / den) >= needed[1]]
+                if fitting:
+                    scale = min(fitting, key=lambda factor: factor[0] / factor[1])
+            pixels = self.turbo.decode(data, pixel_format=TJPF_RGB, scaling_factor=scale)
+
+        with timed("convert"):
+            image = Image.fromarray(pixels, "RGB")
+            if needed:
+                image = reduceImage(image, needed)
+
+        image.info["original_size"] = original_size
+        return image
+
+# registered decoders by name
+decoders = {}
+
+# order the decoders are tried in after the ones of the format chain (PIL decoded everything before)
+default_order = []
+
+def registerDecoder(decoder):
+    """ make decoder (name, available(), supports(format), decode(file, format, size)) known to decodeImage """
+    decoders[decoder.name] = decoder
+    if decoder.name not in default_order:
+        default_order.append(decoder.name)
+
+registerDecoder(PilDecoder())
+registerDecoder(TurboJpegDecoder())
+
+# format -> decoder names ordered by speed without a benchmark result of this machine:
+# libjpeg-turbo decodes scaled straight to RGB, PIL needs the extra conversion (see benchmark_decoders.py)
+default_chains = {"jpeg": ["turbojpeg", "pil"]}
+
+# format -> decoder names ordered by speed, from the benchmark (see setupDecoders) or default_chains
+chains = dict(default_chains)
+
+def decoderChain(format):
+    """ the available decoders for format (None if unknown), fastest first, the others follow as fallbacks """
+    names = chains.get(format, []) + [name for name in default_order if name not in chains.get(format, [])]
+    return [decoders[name] for name in names if name in decoders and decoders[name].available() and decoders[name].supports(format)]
+
+def decodeImage(file, size = None):
+    """
+    Decode the image in file (path or seekable bytestream) as RGB PIL.Image
+    The format is sniffed from the first bytes of the file and the decoders for it are tried fastest first,
+    until one of them succeeds. If size is given, the image is only decoded as large as needed to fit it into size
+    image.info["original_size"] holds the size of the full image
+    """
+    start = 0 if isinstance(file, str) else file.tell()
+    format = sniffFormat(readHead(file))
+
+    errors = []
+    for decoder in decoderChain(format):
+        try:
+            return decoder.decode(file, format, size)
+        except Exception as ex:
+            errors.append("%s: %s" % (decoder.name, ex))
+            log.warning("Decoder %s failed (format %s): %s", decoder.name, format or "unknown", ex)
+            if not isinstance(file, str):
+                file.seek(start)
+    raise IOError("Can't decode the image (format %s): %s" % (format or "unknown", "; ".join(errors) or "no decoder"))
+
+def benchmarkPage(format, size):
+    """ encoded synthetic page (gradients and noise, like a scan) of size in format """
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), Image.effect_noise(size, 48)))
+    # fast encoder settings, the benchmark measures decoding
+    options = {"png": {"compress_level": 1}, "webp": {"method": 0}}.get(format, {})
+    if format == "gif":
+        image = image.convert("P")
+    data = io.BytesIO()
+    image.save(data, format.upper(), **options)
+    return data.getvalue()
+
+def benchmarkDecoders(page_size = (1000, 1400), fit_size = (1280, 1024), runs = 3):
+    """
+    Built-in decoder benchmark: decodes a synthetic page of page_size per format with every available decoder,
+    once at full size and once fitted into fit_size (like a page turn), runs times each
+    returns format -> decoder name -> median ms of a full and a fitted decode
+    """
+    results = {}
+    for format in image_formats:
+        try:
+            data = benchmarkPage(format, page_size)
+        except Exception as ex:
+            log.info("Decoder benchmark: can't encode %s pages: %s", format, ex)
+            continue
+
+        results[format] = {}
+        for decoder in decoderChain(format):
+            times = []
+            try:
+                for run in range(runs):
+                    start = time.perf_counter()
+                    decoder.decode(io.BytesIO(data), format, None)
+                    decoder.decode(io.BytesIO(data), format, fit_size)
+                    times.append((time.perf_counter() - start) * 1000)
+            except Exception as ex:
+                log.info("Decoder benchmark: %s can't decode %s pages: %s", decoder.name, format, ex)
+                continue
+            results[format][decoder.name] = sorted(times)[len(times) // 2]
+    return results
+
+def decoderVersions():
+    """ the decoder libraries the benchmark results are valid for """
+    versions = {"pil": Image.__version__}
+    versions["decoders"] = sorted(name for name, decoder in decoders.items() if decoder.available())
+    return versions
+
+def applyBenchmark(results):
+    """ order the decoders per format by the benchmark results (format -> decoder name -> ms) """
+    global chains
+    chains = dict((format, sorted(timings, key=timings.get)) for format, timings in results.items())
+    for format, names in sorted(chains.items()):
+        log.info("Decoders for %s: %s", format, ", ".join(names))
+
+def saveBenchmark(path, results):
+    """ store the benchmark results at path (JSON), for setupDecoders """
+    # written aside first, an interrupted write leaves no broken file behind
+    with open(path + ".tmp", "w") as f:
+        json.dump({"versions": decoderVersions(), "results": results}, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def setupDecoders(path):
+    """
+    Choose the decoders per format from the benchmark stored at path (see benchmark_decoders.py --save)
+    Without one (or if the decoder libraries changed since), the shipped default_chains are used.
+    The benchmark never runs inside the reader, it would compete with decoding the pages
+    """
+    global chains
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (IOError, OSError, ValueError):
+        stored = None
+
+    if isinstance(stored, dict) and stored.get("versions") == decoderVersions() and isinstance(stored.get("results"), dict):
+        applyBenchmark(stored["results"])
+        return
+    if stored is not None:
+        log.info("Decoder libraries changed since the decoder benchmark, using the default decoder order")
+    chains = dict(default_chains)
@@ -0,0 +1,112 @@
+import os
+import json
+import sqlite3
+import threading
+
+from PyMangaLogger import log
+
+def fileStamp(path):
+    """
+    (mtime, size) of the file/directory on disk, used to validate index entries
+    returns None if path can't be accessed
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+# version of the stored listings (kept in the user_version of the database), listings of older versions are dropped
+# 1: sorted naturally, 2: dotted numbers ("1.10") compared part by part
+listings_version = 2
+
+class LibraryIndex(object):
+    """
+    Persistent SQLite index of directory and archive listings (and the sizes, thumbnails and adjustments of the pages in them)
+    Each listing is stored together with the stamp (mtime, size) of the file on disk it was read from
+    and is only read again once that file changed, so unchanged directories/archives are never rescanned
+    """
+    path = None # path to the database file
+    db   = None # sqlite3 connection, shared between threads and guarded by lock
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS listings (key TEXT PRIMARY KEY, mtime REAL, size INTEGER, entries TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS dimensions (key TEXT PRIMARY KEY, mtime REAL, size INTEGER, width INTEGER, height INTEGER)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS thumbnails (key TEXT, size INTEGER, mtime REAL, filesize INTEGER, data BLOB, PRIMARY KEY (key, size))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS adjustments (key TEXT PRIMARY KEY, mtime REAL, size INTEGER, crop TEXT, levels TEXT)")
+            if self.db.execute("PRAGMA user_version").fetchone()[0] < listings_version:
+                # listings are stored in sort order, an older order has to be read again
+                log.info("Library index: dropping listings stored in an older order")
+                self.db.execute("DELETE FROM listings")
+                self.db.execute("PRAGMA user_version = %d" % listings_version)
+            self.db.commit()
+
+    def lookup(self, key, stamp):
+        """ returns the stored entries for the layer key or None if there are none or they are outdated """
+        with self.lock:
+            row = self.db.execute("SELECT mtime, size, entries FROM listings WHERE key = ?", (json.dumps(key),)).fetchone()
+        if row is None or (row[0], row[1]) != stamp:
+            return None
+        return json.loads(row[2])
+
+    def store(self, key, stamp, entries):
+        """ store the entries (list of [name, isdir] pairs) for the layer key """
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO listings (key, mtime, size, entries) VALUES (?, ?, ?, ?)",
+                            (json.dumps(key), stamp[0], stamp[1], json.dumps(entries)))
+            self.db.commit()
+
+    def lookupDimensions(self, key, stamp):
+        """ returns the stored (width, height) of the page with the layer key or None if it is unknown or outdated """
+        with self.lock:
+            row = self.db.execute("SELECT mtime, size, width, height FROM dimensions WHERE key = ?", (json.dumps(key),)).fetchone()
+        if row is None or (row[0], row[1]) != stamp:
+            return None
+        return (row[2], row[3])
+
+    def storeDimensions(self, rows):
+        """ store the page sizes rows ([(layer key, stamp, (width, height))]) in one transaction """
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO dimensions (key, mtime, size, width, height) VALUES (?, ?, ?, ?, ?)",
+                                [(json.dumps(key), stamp[0], stamp[1], size[0], size[1]) for key, stamp, size in rows])
+            self.db.commit()
+
+    def lookupThumbnail(self, key, size, stamp):
+        """ returns the encoded thumbnail of size for the layer key or None if there is none or it is outdated """
+        with self.lock:
+            row = self.db.execute("SELECT mtime, filesize, data FROM thumbnails WHERE key = ? AND size = ?", (json.dumps(key), size)).fetchone()
+        if row is None or (row[0], row[1]) != stamp:
+            return None
+        return bytes(row[2])
+
+    def storeThumbnail(self, key, size, stamp, data):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO thumbnails (key, size, mtime, filesize, data) VALUES (?, ?, ?, ?, ?)",
+                            (json.dumps(key), size, stamp[0], stamp[1], sqlite3.Binary(data)))
+            self.db.commit()
+
+    def lookupAdjustments(self, key, stamp):
+        """ returns the stored (crop box, levels) of the page with the layer key or None if it is unknown or outdated """
+        with self.lock:
+            row = self.db.execute("SELECT mtime, size, crop, levels FROM adjustments WHERE key = ?", (json.dumps(key),)).fetchone()
+        if row is None or (row[0], row[1]) != stamp:
+            return None
+        crop, levels = json.loads(row[2]), json.loads(row[3])
+        return (tuple(crop) if crop else None, tuple(levels) if levels else None)
+
+    def storeAdjustments(self, rows):
+        """ store the page analysis rows ([(layer key, stamp, (crop box or None, levels or None))], see PyMangaPreprocess) in one transaction """
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO adjustments (key, mtime, size, crop, levels) VALUES (?, ?, ?, ?, ?)",
+                                [(json.dumps(key), stamp[0], stamp[1], json.dumps(adjustments[0]), json.dumps(adjustments[1]))
+                                 for key, stamp, adjustments in rows])
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,19 +1,31 @@
 import os
 import zipfile
 import re, io
-import rarfile
+import threading
 
 #from PyQt5.QtGui import QImage
 from PIL import Image
 from PyMangaLogger import log
+from PyMangaCache import PageCache
+from PyMangaIndex import LibraryIndex, fileStamp
+from PyMangaStream import rootRange, isStoredMember, storedMemberFile, mapArchive, mappedMemberFile, spillToMap
+from PyMangaPool import ArchivePool
+from PyMangaRarCache import RarExtractCache
+from PyMangaTiming import timed
+from PyMangaDecoders import image_extensions, decodeImage
 
 supported_archives = [".zip", ".cbz"]
 def isSupportedArchive(file):
-    if os.path.isdir(file):
+    """ needs a stat call for the type of file, prefer isSupportedEntry with the type from os.scandir """
+    return isSupportedEntry(file, os.path.isdir(file))
+
+def isSupportedEntry(name, isdir):
+    """ like isSupportedArchive but for directory entries with known type (no filesystem access) """
+    if isdir:
         return True
 
     global supported_archives
-    fileName, fileExtension = os.path.splitext(file)
+    fileName, fileExtension = os.path.splitext(name)
     return fileExtension.lower() in supported_archives
 
 zip_like_archives = [".zip", ".cbz"]
@@ -28,15 +40,60 @@ def isRar(path):
     fileName, fileExtension = os.path.splitext(path)
     return fileExtension.lower() in rar_like_archives
 
-supported_images = [".png", ".jpg", ".gif"]
+supported_images = list(image_extensions)
 def isImage(file):
     global supported_images
     fileName, fileExtension = os.path.splitext(file)
     return fileExtension.lower() in supported_images
 
-# UnRAR stuff
-rarfile.UNRAR_TOOL = "unrar"
-rarfile.PATH_SEP = '\\'
+# numbers (also dotted like "10.5" or "1.10") in names, compared by value part by part
+natural_numbers = re.compile(r"(\d+(?:\.\d+)*)")
+# separators between the words of a name, ignored when comparing
+natural_separators = re.compile(r"[\s_\-.]+")
+# spellings of the same prefix, compared as one
+natural_prefixes = {"volume": "vol", "v": "vol", "chapter": "ch", "chap": "ch", "c": "ch"}
+
+def naturalSortKey(name):
+    """
+    sort key for ordering names like a human would: "Chapter 2" < "Ch 10" < "Ch 10.5" < "Ch 10.10" < "Chapter 11"
+    Numbers compare by value (so zero padding doesn't matter), the dot-separated parts of a number each as integer,
+    text case-insensitive without separators
+    """
+    key = []
+    for i, chunk in enumerate(natural_numbers.split(name)):
+        if i % 2:
+            key.append((0, tuple(int(part) for part in chunk.split(".")), ""))
+        else:
+            text = natural_separators.sub("", chunk.lower())
+            if text:
+                key.append((1, (), natural_prefixes.get(text, text)))
+    # equal keys ("1" and "01") still need a stable order
+    return (key, name)
+
+def isReducedImage(image):
+    """ True if image was decoded smaller than its original size """
+    return image.size != image.info.get("original_size", image.size)
+
+# UnRAR stuff, the rarfile module is only imported once a rar archive is opened (see rarModule)
+unrar_tool = "unrar"
+rarfile = None
+
+def rarModule():
+    """ the rarfile module configured with the unrar tool, imported on first use to keep it out of the startup """
+    global rarfile
+    if rarfile is None:
+        import rarfile as module
+        module.UNRAR_TOOL = unrar_tool
+        module.PATH_SEP = '\\'
+        rarfile = module
+    return rarfile
+
+# rar pages are extracted in batches of this many pages with one unrar call
+rar_batch_size = 32
+rar_cache = RarExtractCache()
+
+def setupRarCache(megabytes):
+    rar_cache.setBudget(int(megabytes) * 1024 * 1024)
 
 def isRARactive():
     global supported_archives
@@ -44,19 +101,104 @@ def isRARactive():
     return len(rars) > 0
 
 def setupUnrar(unrar_path):
-    global supported_archives
+    global supported_archives, unrar_tool
     unrar = which(unrar_path)
     if unrar is None:
-        log.warning("UnRAR executable not accessible: %s" % unrar_path)
+        log.warning("UnRAR executable not accessible: %s", unrar_path)
         log.warning("Disabling rar archive support...")
-        rarfile.UNRAR_TOOL = None
         supported_archives = [x for x in supported_archives if x not in rar_like_archives]
     else:
-        log.info("UnRAR executable accessible: %s" % unrar)
+        log.info("UnRAR executable accessible: %s", unrar)
         log.info("Enabling rar archive support...")
-        rarfile.UNRAR_TOOL = unrar
         supported_archives += rar_like_archives
 
+    unrar_tool = unrar
+    rar_cache.tool = unrar
+    if rarfile:
+        rarfile.UNRAR_TOOL = unrar
+
+# decoded page cache
+page_cache = PageCache()
+
+def setupPageCache(megabytes):
+    page_cache.setBudget(int(megabytes) * 1024 * 1024)
+    log.info("Page cache budget: %d MB", int(megabytes))
+
+# opened archives shared by all layers
+archive_pool = ArchivePool()
+
+def setupArchivePool(capacity):
+    archive_pool.setCapacity(int(capacity))
+
+# persistent index of directory/archive listings
+library_index = None
+
+def setupLibraryIndex(path):
+    global library_index
+    if library_index:
+        if library_index.path == path:
+            return
+        library_index.close()
+        library_index = None
+
+    try:
+        library_index = LibraryIndex(path)
+        log.info("Using library index: %s", path)
+    except Exception as ex:
+        log.warning("Library index not accessible: %s (%s)", path, ex)
+
+def indexedListing(key, read):
+    """
+    returns the listing ([name, isdir] pairs) for the layer key from the library index
+    read() is called to create the listing if the index doesn't have it or it is outdated
+    The listing is sorted naturally (see naturalSortKey) once when it is read, the index stores it in that order
+    """
+    stamp = fileStamp(key[0])
+    if library_index and stamp:
+        entries = library_index.lookup(key, stamp)
+        if entries is not None:
+            log.info("Listing '%s' from library index", key[-1])
+            return entries
+
+    entries = sorted(read(), key=lambda entry: naturalSortKey(entry[0]))
+    if library_index and stamp:
+        library_index.store(key, stamp, entries)
+    return entries
+
+def pageDimensions(layers):
+    """
+    returns the (width, height) of the images of the image layers (None where it can't be read)
+    The sizes are read from the image headers (see Layer.dimensions) and remembered in the library index
+    """
+    stamps = {}
+    sizes = []
+    read = []
+    for layer in layers:
+        path = layer.key[0]
+        if path not in stamps:
+            stamps[path] = fileStamp(path)
+        stamp = stamps[path]
+
+        size = None
+        if library_index and stamp:
+            size = library_index.lookupDimensions(layer.key, stamp)
+        if size is None:
+            size = layer.dimensions()
+            if size and stamp:
+                read.append((layer.key, stamp, size))
+        sizes.append(size)
+
+    if library_index and read:
+        library_index.storeDimensions(read)
+    return sizes
+
+def listDirectory(path):
+    """ returns [name, isdir] pairs for the entries in the directory path """
+    def read():
+        with os.scandir(path) as it:
+            return [[entry.name, entry.is_dir()] for entry in it]
+    return indexedListing((path,), read)
+
 def which(program):
     '''
     Check if a program is in PATH
@@ -81,10 +223,19 @@ def which(program):
     return None
 
 class Zip(object):
-    """ zipfile wrapper with a totally simple API """
+    """
+    zipfile wrapper with a totally simple API
+    The archive file is mapped into memory once, uncompressed members are read from the mapping
+    Reading a mapping whose file was truncated meanwhile kills the process (SIGBUS), so the stamp of the file
+    is checked before every member handed out and the mapping is dropped once it changed. A file rewritten
+    while a member is being decoded still isn't caught, that window is accepted for reading without copies
+    """
     zipfile = None  # zipfile instance
     file    = None
     names   = None  # archive content of zipfile/file
+    view    = None  # memoryview over the mapped archive file or None if it isn't mapped
+    base    = 0     # offset of the archive in view (archives stored inside other archives)
+    stamp   = None  # (mtime, size) of the mapped archive file when it was mapped, None for private mappings
 
     def __init__(self, file):
         self.file = file
@@ -94,29 +245,171 @@ class Zip(object):
         """ load filenames in the archive pointed to by file """
         self.zipfile = zipfile.ZipFile(file, "r")
         self.names = self.zipfile.namelist()
+        self.view, self.base = mapArchive(file)
+        root = rootRange(file)[0]
+        if self.view is not None and isinstance(root, str):
+            self.stamp = fileStamp(root)
 
     def open(self, name):
-        """ open the file with name in this archive as bytestream """
-        return io.BytesIO(self.zipfile.read(name))
+        """
+        open the file with name in this archive as bytestream
+        uncompressed members are slices of the mapping, read without an intermediate copy (the OS page cache
+        does the caching), compressed ones are decompressed into memory
+        """
+        info = self.zipfile.getinfo(name)
+        view = self.view
+        if view is not None and isStoredMember(info) and self.mappingValid():
+            return mappedMemberFile(view, self.base, info)
+        return io.BytesIO(self.zipfile.read(info))
+
+    def mappingValid(self):
+        """ False (and the mapping is dropped) if the mapped archive file changed on disk since it was mapped """
+        if self.stamp is None or fileStamp(rootRange(self.file)[0]) == self.stamp:
+            return True
+        log.warning("Archive '%s' changed on disk, not reading it from memory anymore", rootRange(self.file)[0])
+        view, self.view = self.view, None
+        if view is not None:
+            view.release()
+        return False
+
+    def openStream(self, name):
+        """
+        open the file with name in this archive as seekable file without reading it into memory
+        uncompressed members are read directly from the archive file,
+        compressed ones are extracted into a memory mapped temp file
+        """
+        info = self.zipfile.getinfo(name)
+        if isStoredMember(info):
+            return storedMemberFile(self, info)
+        return spillToMap(self.zipfile.open(info))
+
+    def close(self):
+        self.zipfile.close()
+        if self.view is not None:
+            # member streams still being decoded keep the mapping alive until they are closed
+            self.view.release()
+            self.view = None
+        if not isinstance(self.file, str):
+            # zipfile doesn't close file objects it didn't open
+            self.file.close()
 
 class Rar(object):
     """ rarfile wrapper with a totally simple API """
     rarfile = None
     file    = None
     names   = None  # archive content of rarfile/file
+    extract_dir = None # directory in rar_cache the pages are extracted to
 
     def __init__(self, file):
         self.file = file
+        self.lock = threading.Lock()
+        self.extracting = {} # member name -> threading.Event set once the batch extracting it is done
         self.load(file)
 
     def load(self, file):
         """ load files in the archive pointed to by file """
-        self.rarfile = rarfile.RarFile(file, "r")
-        self.names = self.rarfile.namelist()
+        self.rarfile = rarModule().RarFile(file, "r")
+        self.names = sorted(self.rarfile.namelist(), key=naturalSortKey)
+
+    def open(self, name):
+        """
+        open the file with name in this archive as bytestream
+        Images are extracted together with the following pages in their directory by a single unrar call
+        (instead of one unrar process per page) and served from rar_cache afterwards
+        The lock isn't held while unrar runs, pages of a batch being extracted wait for that batch
+        """
+        if isImage(name):
+            batch = None
+            with self.lock:
+                path = self.extractedPath(name)
+                data = rar_cache.read(path)
+                if data is None:
+                    done = self.extracting.get(name)
+                    if done is None:
+                        batch = self.nextBatch(name)
+                        done = threading.Event()
+                        for member in batch:
+                            self.extracting[member] = done
+
+            if data is None:
+                if batch is not None:
+                    try:
+                        # the farthest page is recorded first, so it is evicted first
+                        rar_cache.extract(self.file, list(reversed(batch)), self.extract_dir)
+                    finally:
+                        with self.lock:
+                            for member in batch:
+                                self.extracting.pop(member, None)
+                        done.set()
+                else:
+                    done.wait()
+                data = rar_cache.read(path)
+            if data is not None:
+                return io.BytesIO(data)
+
+        with self.lock:
+            return io.BytesIO(self.rarfile.read(name))
+
+    def extractedPath(self, name):
+        if self.extract_dir is None:
+            self.extract_dir = rar_cache.newArchiveDir()
+        return os.path.join(self.extract_dir, *re.split(r"[\\/]", name))
+
+    def nextBatch(self, name):
+        """ name and the next pages in its directory that aren't extracted or being extracted yet, needs the lock """
+        folder = os.path.dirname(name.replace("\\", "/"))
+        pages = [n for n in self.names if isImage(n) and os.path.dirname(n.replace("\\", "/")) == folder]
+        start = pages.index(name) if name in pages else 0
+        batch = [n for n in pages[start:] if n not in self.extracting and not rar_cache.contains(self.extractedPath(n))][:rar_batch_size]
+        if name not in batch:
+            batch.insert(0, name)
+        return batch
+
+    def openStream(self, name):
+        """ open the file with name in this archive as seekable file (extracted into a memory mapped temp file) """
+        return spillToMap(self.rarfile.open(name))
+
+    def close(self):
+        # rarfile only opens the archive while reading from it
+        close = getattr(self.rarfile, "close", None)
+        if close:
+            close()
+
+        if self.extract_dir:
+            rar_cache.removeArchiveDir(self.extract_dir)
+            self.extract_dir = None
+
+class LazyArchive(object):
+    """
+    Stands in for the Zip/Rar of a layer
+    The real archive is only opened when a member is accessed (the listing may come from the library index)
+    and is shared with other layers through the archive pool
+    """
+    layer = None
+    file  = None
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.file = layer.path
+
+    def call(self, function):
+        """ call function with the opened archive, the archive stays in use until it returns """
+        key = (self.layer.key, fileStamp(self.layer.key[0]))
+        archive = archive_pool.acquire(key, self.layer.openArchive)
+        try:
+            return function(archive)
+        finally:
+            archive_pool.release(key)
+
+    def listing(self):
+        return self.call(lambda archive: [[name, False] for name in archive.names])
 
     def open(self, name):
         """ open the file with name in this archive as bytestream """
-        return io.BytesIO(self.rarfile.read(name))
+        return self.call(lambda archive: archive.open(name))
+
+    def openStream(self, name):
+        return self.call(lambda archive: archive.openStream(name))
 
 class Layer():
     """
@@ -124,76 +417,132 @@ class Layer():
     """
     path    = None # path to the archive/dir/image
     archive = None # cache for an opened archive
+    key     = None # identifies the layer across reopenings of its parent (chain of paths)
 
-    def __init__(self, _path, _archive = None):
+    def __init__(self, _path, _archive = None, _parent_key = ()):
         self.archive = _archive
         self.path    = _path
-        
-    def open(self):
+        self.key     = _parent_key + (_path,)
+
+    def cacheKey(self):
+        """
+        key for the page cache: the layer key plus the modification time of the file on disk
+        that contains the layer, so changed archives/images don't serve stale pages
+        returns None if the file can't be accessed
+        """
+        try:
+            mtime = os.path.getmtime(self.key[0])
+        except OSError:
+            return None
+        return self.key + (mtime,)
+
+    def decode(self, size = None):
+        """
+        decode the image self.path points to, returns a PIL.Image or None
+        size limits the decoded size, see decodeImage
+        """
+        if self.archive:
+            # load the image from the archive!
+            log.info("Open image '%s' in archive '%s'", self.path, self.archive.file)
+            with timed("member read"):
+                file = self.archive.open(self.path)
+            try:
+                image = decodeImage(file, size)
+                return image
+            except IOError as ex:
+                log.error("Failed loading image '%s' in archive '%s'", self.path, self.archive.file)
+                return None
+            finally:
+                # releases the archive mapping of stored members
+                file.close()
+        else:
+            log.info("Open image '%s' from filesystem", self.path)
+            return decodeImage(self.path, size)
+
+    def dimensions(self):
+        """ size of the image self.path points to, only the image header is read, returns None if it can't be read """
+        try:
+            if self.archive:
+                file = self.archive.open(self.path)
+                try:
+                    with Image.open(file) as image:
+                        return image.size
+                finally:
+                    file.close()
+            with Image.open(self.path) as image:
+                return image.size
+        except Exception as ex:
+            log.warning("Failed reading the size of '%s': %s", self.path, ex)
+            return None
+
+    def openArchive(self):
+        """ opens the zip/rar archive self.path points to """
+        with timed("archive open"):
+            if isZip(self.path):
+                if self.archive:
+                    log.info("Open zip '%s' in archive '%s'", self.path, self.archive.file)
+                    file = self.archive.openStream(self.path)
+                    return Zip(file)
+                else:
+                    log.info("Open zip '%s' from filesystem", self.path)
+                    return Zip(self.path)
+            else:
+                log.info("Open rar '%s' from filesystem", self.path)
+                return Rar(self.path)
+
+    def open(self, size = None):
         """
         Opens the path the layer was constructed with.
         Handles the type of the path appropriately
-            and returns a list of pairs with (path, Layer) entries
+            and returns a dict of (name, Layer) entries in natural order (see naturalSortKey)
             or a PIL.Image if self.path is an image
+              (only decoded as large as needed to fit into size if size is given)
             or None if it failed to load anything
         """
         entries = None
         if isImage(self.path):
-            # got an image, load it!
-            if self.archive:
-                # load the image from the archive!
-                log.info("Open image '%s' in archive '%s'" % (self.path, self.archive.file))
-                file = self.archive.open(self.path)
-                try:
-                    image = Image.open(file).convert("RGB")
-                    return image
-                except IOError as ex:
-                    log.error("Failed loading image '%s' in archive '%s'" % (self.path, self.archive.file))
-                    return None
+            # got an image, maybe it was decoded before (a full size decode fits every size)
+            cache_key = self.cacheKey()
+            image = None
+            if cache_key:
+                image = page_cache.get(cache_key + (size,))
+                if image is None and size is not None:
+                    image = page_cache.get(cache_key + (None,))
+            if image is not None:
+                log.info("Open image '%s' from page cache", self.path)
                 return image
-            else:
-                log.info("Open image '%s' from filesystem" % self.path)
-                return Image.open(self.path).convert("RGB")
 
-        elif isZip(self.path):
-            # got a zipfile, open it!
-            if self.archive:
-                log.info("Open zip '%s' in archive '%s'" % (self.path, self.archive.file))
-                file = self.archive.open(self.path)
-                archive = Zip(file)
-            else:
-                log.info("Open zip '%s' from filesystem" % self.path)
-                archive = Zip(self.path)
+            image = self.decode(size)
+            if image is not None and cache_key:
+                page_cache.put(cache_key + (size if isReducedImage(image) else None,), image)
+            return image
 
-            name_pairs = [(name, Layer(name, archive)) for name in archive.names if isRar(name) or isZip(name) or isImage(name)]
-            entries = dict(name_pairs)
-
-        elif isRar(self.path) and isRARactive():
-            # got a rarfile, open it!
-            if self.archive:
-                log.info("Open rar '%s' in archive '%s'" % (self.path, self.archive.file))
+        elif isZip(self.path) or (isRar(self.path) and isRARactive()):
+            if isRar(self.path) and self.archive:
+                log.info("Open rar '%s' in archive '%s'", self.path, self.archive.file)
                 #file = self.archive.open(self.path)
                 #archive = Rar(file)
                 log.error("Opening rar archives inside another archive isn't supported!")
                 raise RuntimeError("Opening rar archives inside another archive isn't supported!")
-            else:
-                log.info("Open rar '%s' from filesystem" % self.path)
-                archive = Rar(self.path)
 
-            name_pairs = [(name, Layer(name, archive)) for name in archive.names if isRar(name) or isZip(name) or isImage(name)]
+            # got an archive, list it (the archive itself is only opened if the index can't answer)
+            archive = LazyArchive(self)
+            names = [name for name, isdir in indexedListing(self.key, archive.listing)]
+
+            name_pairs = [(name, Layer(name, archive, self.key)) for name in names if isRar(name) or isZip(name) or isImage(name)]
             entries = dict(name_pairs)
 
         elif os.path.isdir(self.path):
             # load names in directory
-            log.info("Open directory '%s' from filesystem" % self.path)
-            dir = os.listdir(self.path)
+            log.info("Open directory '%s' from filesystem", self.path)
+            dir = listDirectory(self.path)
 
             # save all names in directory
-            name_pairs = [(d, Layer(os.path.join(self.path, d))) for d in dir if isSupportedArchive(os.path.join(self.path, d)) or isImage(d)]
+            name_pairs = [(d, Layer(os.path.join(self.path, d))) for d, isdir in dir if isSupportedEntry(d, isdir) or isImage(d)]
             entries = dict(name_pairs)
 
         else:
-            log.warning("Unknown file: %s" % self.path)
+            log.warning("Unknown file: %s", self.path)
             return None
 
         return entries
\ No newline at end of file
@@ -1,3 +1,4 @@
+import atexit
 import logging
 
 log = logging.getLogger('')
@@ -11,3 +12,27 @@ def setupLoggerFromCmdArgs(argv):
             if not isinstance(numeric_level, int):
                 raise ValueError('Invalid log level: %s' % loglevel)
             logging.basicConfig(level=numeric_level)
+
+def setupProfilerFromCmdArgs(argv):
+    """
+    search for --profile or --profile=FILE: profiles the GUI thread with cProfile until the application exits,
+    the stats are dumped to FILE (default pymanga.prof, see pstats) and the top entries are logged
+    """
+    for arg in argv:
+        if arg == "--profile" or arg.startswith("--profile="):
+            import cProfile, pstats, io
+
+            path = arg[len("--profile="):] if "=" in arg else "pymanga.prof"
+            profiler = cProfile.Profile()
+
+            def dump():
+                profiler.disable()
+                profiler.dump_stats(path)
+                summary = io.StringIO()
+                pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+                log.warning("Profile written to %s\n%s", path, summary.getvalue())
+
+            atexit.register(dump)
+            profiler.enable()
+            return profiler
+    return None
@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+
+from PyMangaLogger import log
+
+class ArchivePool(object):
+    """
+    Process wide pool of opened archives (Zip/Rar), keyed by layer key and file stamp (mtime, size)
+    Archives are reused between Layers, so reading a recently opened archive doesn't parse it again
+    Users acquire an archive for the duration of a read and release it afterwards,
+    unused archives are closed least recently used first once more than capacity archives are open
+    """
+    capacity = 16   # max. number of open archives (roughly the number of open file descriptors)
+    entries  = None # (key, stamp) -> [archive, refcount], least recently used first
+
+    def __init__(self, capacity = 16):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.capacity = capacity
+
+    def setCapacity(self, capacity):
+        with self.lock:
+            self.capacity = max(1, capacity)
+            closing = self.evict()
+        self.close(closing)
+
+    def acquire(self, key, opener):
+        """
+        returns the open archive for key (opened with opener() if it isn't in the pool)
+        every acquire needs a matching release
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                entry[1] += 1
+                self.entries.move_to_end(key)
+                return entry[0]
+
+        # open outside the lock, opening nested archives may take a while
+        archive = opener()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                # somebody else was faster
+                closing = [archive]
+            else:
+                entry = self.entries[key] = [archive, 0]
+                closing = []
+            entry[1] += 1
+            self.entries.move_to_end(key)
+            closing += self.evict()
+
+        self.close(closing)
+        return entry[0]
+
+    def release(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry:
+                entry[1] -= 1
+            closing = self.evict()
+        self.close(closing)
+
+    def clear(self):
+        """ close all unused archives """
+        with self.lock:
+            closing = [entry[0] for key, entry in self.entries.items() if entry[1] <= 0]
+            self.entries = OrderedDict((key, entry) for key, entry in self.entries.items() if entry[1] > 0)
+        self.close(closing)
+
+    def evict(self):
+        """ remove least recently used unreferenced archives above capacity, needs the lock, returns them for closing """
+        closing = []
+        for key in list(self.entries.keys()):
+            if len(self.entries) <= self.capacity:
+                break
+            archive, refcount = self.entries[key]
+            if refcount <= 0:
+                del self.entries[key]
+                closing.append(archive)
+        return closing
+
+    def close(self, archives):
+        for archive in archives:
+            log.debug("Archive pool: closing %s", archive.file)
+            try:
+                archive.close()
+            except Exception as ex:
+                log.warning("Failed closing archive: %s", ex)
@@ -0,0 +1,156 @@
+from PyQt5.QtCore import (QObject, QRunnable, QThreadPool, pyqtSignal)
+from PIL import Image
+
+from PyMangaLogger import log
+from PyMangaLayer import *
+import PyMangaPreprocess
+
+class PlanTask(QRunnable):
+    """ walks the page sequence around the current position and reports the pages to prefetch """
+
+    def __init__(self, prefetcher, generation, sequence, path, ahead, behind):
+        super(PlanTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.generation = generation
+        self.sequence = sequence
+        self.path = path
+        self.ahead = ahead
+        self.behind = behind
+
+    def collect(self, step, count):
+        layers = []
+        try:
+            for path in self.sequence.walk(self.path, step):
+                if len(layers) >= count or self.generation != self.prefetcher.generation:
+                    break
+                layers.append(self.sequence.layer(path))
+        except Exception as ex:
+            log.warning("Prefetch: failed walking from '%s': %s", "/".join(self.path), ex)
+        return layers
+
+    def run(self):
+        # next pages first, they are needed more likely
+        layers = self.collect(1, self.ahead) + self.collect(-1, self.behind)
+        if self.generation == self.prefetcher.generation:
+            self.prefetcher.planned.emit(self.generation, layers)
+
+class DecodeTask(QRunnable):
+    """ decodes (and preprocesses, see PyMangaPreprocess) a single page in a worker thread """
+
+    def __init__(self, prefetcher, layer, size):
+        super(DecodeTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.layer = layer
+        self.size = size
+
+    def run(self):
+        options = PyMangaPreprocess.options
+
+        # page isn't needed anymore (user jumped somewhere else)
+        if self.layer.key not in self.prefetcher.wanted:
+            self.prefetcher.decoded.emit(self.layer.key, self.size, options, None)
+            return
+
+        image = None
+        try:
+            image = PyMangaPreprocess.openPreprocessed(self.layer, self.size, options)
+        except Exception as ex:
+            log.warning("Prefetch: failed decoding '%s': %s", self.layer.path, ex)
+        self.prefetcher.decoded.emit(self.layer.key, self.size, options, image)
+
+class Prefetcher(QObject):
+    """
+    Decodes the pages around the current position in a worker pool
+    and keeps them until the position moves away from them
+    All bookkeeping happens in the GUI thread, workers only report back through signals
+    """
+    imageReady = pyqtSignal(object) # key of a page that finished decoding
+
+    # internal, emitted from the worker threads
+    planned = pyqtSignal(int, object)
+    decoded = pyqtSignal(object, object, object, object) # key, size, preprocessing options, image
+
+    def __init__(self, ahead, behind, threads = 2):
+        super(Prefetcher, self).__init__()
+        self.ahead = ahead
+        self.behind = behind
+
+        self.generation = 0         # incremented on every reschedule, cancels outdated plans
+        self.current = None         # key of the displayed page
+        self.size = None            # decode size limit (see Layer.open)
+        self.wanted = frozenset()   # keys of the pages in the current prefetch window
+        self.images = {}            # key -> (size, decoded PIL.Image, preprocessing options it was made with)
+        self.pending = set()        # keys of the pages currently being decoded
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+
+        self.planned.connect(self.onPlanned)
+        self.decoded.connect(self.onDecoded)
+
+    def schedule(self, sequence, path, current = None, size = None):
+        """
+        Prefetch the pages around the position path in the page sequence (see PageSequence)
+        current is the key of the displayed page, it is kept until the next plan arrives
+        size limits the decoded size of the pages (see Layer.open)
+        """
+        self.generation += 1
+        self.current = current
+        self.size = size
+        if current is not None:
+            self.wanted = self.wanted | {current}
+        self.pool.start(PlanTask(self, self.generation, sequence, path, self.ahead, self.behind))
+
+    def request(self, layer, size = None):
+        """ decode the page of the image layer right away (ahead of the prefetched ones), reported through imageReady """
+        self.wanted = self.wanted | {layer.key}
+        if layer.key in self.pending:
+            return
+        self.pending.add(layer.key)
+        self.pool.start(DecodeTask(self, layer, size), 1)
+
+    def cancel(self):
+        """ drop everything and stop outstanding work as soon as possible """
+        self.generation += 1
+        self.current = None
+        self.wanted = frozenset()
+        self.images.clear()
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
+
+    def get(self, key, size = None):
+        """ returns the prefetched image for key decoded for size (or at full size) with the current preprocessing or None """
+        entry = self.images.get(key)
+        if entry is None or entry[0] not in (size, None) or entry[2] != PyMangaPreprocess.options:
+            return None
+        return entry[1]
+
+    def isPending(self, key):
+        return key in self.pending
+
+    def onPlanned(self, generation, layers):
+        if generation != self.generation:
+            return
+
+        self.wanted = frozenset([layer.key for layer in layers] + [self.current])
+
+        # forget images outside of the new window
+        for key in [key for key in self.images if key not in self.wanted]:
+            del self.images[key]
+
+        for layer in layers:
+            if self.get(layer.key, self.size) is not None or layer.key in self.pending:
+                continue
+            self.pending.add(layer.key)
+            self.pool.start(DecodeTask(self, layer, self.size))
+
+    def onDecoded(self, key, size, options, image):
+        self.pending.discard(key)
+        if key not in self.wanted:
+            return
+
+        if isinstance(image, Image.Image):
+            self.images[key] = (size if isReducedImage(image) else None, image, options)
+        self.imageReady.emit(key)
@@ -0,0 +1,214 @@
+import threading
+from functools import lru_cache
+
+from PIL import Image
+
+import PyMangaLayer
+from PyMangaLogger import log
+from PyMangaCache import PageCache
+from PyMangaIndex import fileStamp
+from PyMangaTiming import timed
+
+# numpy is only imported once a page is analyzed, so it stays out of the startup (see numpyModule)
+numpy = None
+
+def numpyModule():
+    """ the numpy module or False if it isn't installed """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy as module
+            numpy = module
+        except ImportError:
+            log.warning("NumPy isn't installed, pages aren't cropped/leveled")
+            numpy = False
+    return numpy
+
+# current preprocessing options (auto crop, auto levels, gamma), see setupPreprocessing
+options = (False, False, 1.0)
+
+def setupPreprocessing(auto_crop, auto_levels, gamma):
+    global options
+    options = (bool(auto_crop), bool(auto_levels), float(gamma))
+    log.info("Page preprocessing: auto crop %s, auto levels %s, gamma %.2f", *options)
+    if isEnabled(options) and numpy is None:
+        # importing takes about 100 ms, not on the GUI thread
+        threading.Thread(target=numpyModule, name="numpy import", daemon=True).start()
+
+def isEnabled(opts):
+    auto_crop, auto_levels, gamma = opts
+    return auto_crop or auto_levels
+
+# pages are analyzed at about this size, margins and histograms don't need more
+analysis_size = 512
+
+# a border only counts as margin if it is about white or black (gray level)
+margin_light = 200
+margin_dark = 55
+# pixels that differ less from the border color are margin (scan noise, paper structure)
+margin_tolerance = 48
+# rows/columns with less content than this fraction are margin (dust, speckles)
+content_ratio = 0.005
+# kept around the content, as fraction of the longer page side
+crop_padding = 0.01
+# the content has to cover at least this fraction of the page width and height, so nearly empty pages stay as they are
+min_content = 0.5
+# cropping less than this fraction of the page area isn't worth it
+min_crop = 0.03
+
+# fraction of the darkest/lightest pixels that are clipped by the auto levels
+levels_clip = 0.005
+# levels spanning less than this aren't stretched (about uniform pages)
+min_levels_range = 64
+
+def contentBox(np, pixels):
+    """ (left, top, right, bottom) of the content of the grayscale page pixels inside a white/black margin or None """
+    height, width = pixels.shape
+    border = np.concatenate((pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]))
+    background = int(np.median(border))
+    if margin_dark < background < margin_light:
+        return None
+
+    content = np.abs(pixels.astype(np.int16) - background) > margin_tolerance
+    rows = np.flatnonzero(content.mean(axis=1) > content_ratio)
+    columns = np.flatnonzero(content.mean(axis=0) > content_ratio)
+    if not rows.size or not columns.size:
+        return None
+
+    padding = int(round(max(width, height) * crop_padding))
+    left, right = max(0, int(columns[0]) - padding), min(width, int(columns[-1]) + 1 + padding)
+    top, bottom = max(0, int(rows[0]) - padding), min(height, int(rows[-1]) + 1 + padding)
+
+    if right - left < width * min_content or bottom - top < height * min_content:
+        return None
+    if (right - left) * (bottom - top) > width * height * (1 - min_crop):
+        return None
+    return (left, top, right, bottom)
+
+def levelRange(np, pixels):
+    """ (black, white) gray levels the content of the grayscale page pixels spans or None if it spans about all """
+    cumulative = np.cumsum(np.bincount(pixels.ravel(), minlength=256))
+    black = int(np.searchsorted(cumulative, cumulative[-1] * levels_clip))
+    white = int(np.searchsorted(cumulative, cumulative[-1] * (1 - levels_clip)))
+    if white - black < min_levels_range or (black <= 4 and white >= 251):
+        return None
+    return (black, white)
+
+def analyzePage(image):
+    """
+    Find the margins and the gray levels of the page image (PIL.Image, maybe decoded reduced)
+    returns (crop box in original image coordinates or None, (black, white) or None)
+    """
+    np = numpyModule()
+    if not np:
+        return (None, None)
+
+    gray = image.convert("L")
+    factor = max(gray.size) // analysis_size
+    if factor >= 2:
+        gray = gray.reduce(factor)
+    pixels = np.asarray(gray)
+
+    box = contentBox(np, pixels)
+    if box:
+        # back to the coordinates of the original image
+        original = image.info.get("original_size", image.size)
+        sx, sy = original[0] / gray.size[0], original[1] / gray.size[1]
+        box = (int(box[0] * sx), int(box[1] * sy), min(original[0], int(round(box[2] * sx))), min(original[1], int(round(box[3] * sy))))
+    return (box, levelRange(np, pixels))
+
+@lru_cache(maxsize=64)
+def levelsTable(black, white, gamma):
+    """ lookup table for Image.point stretching [black, white] to [0, 255] with gamma, for all three RGB bands """
+    # plain Python, known adjustments are also applied on the GUI thread (without importing NumPy)
+    levels = [min(1.0, max(0.0, (value - black) / max(1, white - black))) ** (1 / gamma) for value in range(256)]
+    return [int(level * 255 + 0.5) for level in levels] * 3
+
+# analysis results per page (layer key, stamp), in front of the library index
+adjustments_cache = PageCache(4096, lambda adjustments: 1)
+
+# analysis results not written to the library index yet, written in batches of adjustments_batch
+pending_adjustments = []
+adjustments_batch = 32
+adjustments_lock = threading.Lock()
+
+def knownAdjustments(layer, stamp):
+    """ the analysis of the page of the image layer from the cache or the library index, None if it wasn't analyzed yet """
+    key = (layer.key, stamp)
+    adjustments = adjustments_cache.get(key)
+    if adjustments is None:
+        index = PyMangaLayer.library_index
+        if index and stamp:
+            adjustments = index.lookupAdjustments(layer.key, stamp)
+        if adjustments is not None:
+            adjustments_cache.put(key, adjustments)
+    return adjustments
+
+def needsAnalysis(layer, opts = None):
+    """ True if preprocessing the page of the image layer with opts (the current options if not given) needs an analysis first """
+    if not isEnabled(opts or options) or numpy is False:
+        return False
+    return numpy is None or knownAdjustments(layer, fileStamp(layer.key[0])) is None
+
+def pageAdjustments(layer, image, analyze = True):
+    """
+    returns the analysis (see analyzePage) of the page of the image layer, image is the decoded page
+    Results are remembered per page and stored in the library index, so every page is only analyzed once
+    Without analyze (on the GUI thread) only known results are returned, None if there is none
+    """
+    stamp = fileStamp(layer.key[0])
+    adjustments = knownAdjustments(layer, stamp)
+    if adjustments is not None or not analyze or not numpyModule():
+        return adjustments
+
+    adjustments = analyzePage(image)
+    adjustments_cache.put((layer.key, stamp), adjustments)
+    if stamp:
+        with adjustments_lock:
+            pending_adjustments.append((layer.key, stamp, adjustments))
+            full = len(pending_adjustments) >= adjustments_batch
+        if full:
+            flushAdjustments()
+    return adjustments
+
+def flushAdjustments():
+    """ write the pending analysis results to the library index in one transaction """
+    global pending_adjustments
+    with adjustments_lock:
+        rows, pending_adjustments = pending_adjustments, []
+    index = PyMangaLayer.library_index
+    if rows and index:
+        index.storeAdjustments(rows)
+
+def preprocessPage(layer, image, opts = None, analyze = True):
+    """
+    Crop the margins and/or stretch the levels of the page image (PIL.Image) decoded from the image layer
+    according to opts (the current options if not given), returns the adjusted image or image itself
+    Without analyze, pages that weren't analyzed yet are returned as they are (see pageAdjustments)
+    image.info["original_size"] becomes the size of the cropped original, so isReducedImage still works
+    """
+    opts = opts or options
+    auto_crop, auto_levels, gamma = opts
+    if not isEnabled(opts) or not isinstance(image, Image.Image):
+        return image
+
+    with timed("preprocess"):
+        adjustments = pageAdjustments(layer, image, analyze)
+        if adjustments is None:
+            return image
+        box, levels = adjustments
+        original = image.info.get("original_size", image.size)
+
+        if auto_crop and box:
+            sx, sy = image.size[0] / original[0], image.size[1] / original[1]
+            image = image.crop((int(box[0] * sx), int(box[1] * sy), int(round(box[2] * sx)), int(round(box[3] * sy))))
+            image.info["original_size"] = (box[2] - box[0], box[3] - box[1])
+
+        if auto_levels and (levels or gamma != 1.0):
+            black, white = levels or (0, 255)
+            image = image.point(levelsTable(black, white, gamma))
+    return image
+
+def openPreprocessed(layer, size = None, opts = None, analyze = True):
+    """ Layer.open followed by preprocessPage """
+    return preprocessPage(layer, layer.open(size), opts, analyze)
@@ -0,0 +1,105 @@
+import json
+import time
+import sqlite3
+
+from PyMangaLogger import log
+
+class ProgressStore(object):
+    """
+    Persistent SQLite store of the reading progress
+    Keeps the last read position (volume, chapter, page names) of every manga with its timestamp
+    and a history of the read positions per manga: one entry per chapter read (the last page read in it),
+    at most history_limit per manga
+    Positions are recorded in memory and written in one transaction by flush(),
+    the write ahead log keeps the file consistent if the application crashes in between
+    """
+    path    = None # path to the database file
+    db      = None # sqlite3 connection
+    pending = None # manga -> (position, timestamp) recorded since the last flush
+
+    history_limit = 200 # history entries kept per manga
+
+    def __init__(self, path):
+        self.path = path
+        self.pending = {}
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS progress (manga TEXT PRIMARY KEY, position TEXT, read_at REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS history (manga TEXT, position TEXT, read_at REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS history_manga ON history (manga, read_at)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS migrations (source TEXT PRIMARY KEY)")
+        self.db.commit()
+
+    def record(self, manga, position):
+        """ remember position (list of names) as the current position in manga, written by the next flush """
+        self.pending[manga] = (list(position), time.time())
+
+    def lookup(self, manga):
+        """ returns the last recorded position in manga or None """
+        if manga in self.pending:
+            return self.pending[manga][0]
+        row = self.db.execute("SELECT position FROM progress WHERE manga = ?", (manga,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def flush(self):
+        """ write all recorded positions in one transaction """
+        if not self.pending:
+            return
+
+        pending = self.pending
+        self.pending = {}
+        try:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO progress (manga, position, read_at) VALUES (?, ?, ?)",
+                                    [(manga, json.dumps(position), read_at) for manga, (position, read_at) in pending.items()])
+                for manga, (position, read_at) in pending.items():
+                    self.addHistory(manga, position, read_at)
+        except sqlite3.Error as ex:
+            log.warning("Failed saving reading progress: %s", ex)
+        else:
+            log.info("Saved reading progress of %d mangas", len(pending))
+
+    def addHistory(self, manga, position, read_at):
+        """ add position to the history of manga, within the chapter of the newest entry that entry is updated instead """
+        last = self.db.execute("SELECT rowid, position FROM history WHERE manga = ? ORDER BY read_at DESC LIMIT 1", (manga,)).fetchone()
+        if last and json.loads(last[1])[:-1] == position[:-1]:
+            self.db.execute("UPDATE history SET position = ?, read_at = ? WHERE rowid = ?", (json.dumps(position), read_at, last[0]))
+            return
+
+        self.db.execute("INSERT INTO history (manga, position, read_at) VALUES (?, ?, ?)", (manga, json.dumps(position), read_at))
+        self.db.execute("DELETE FROM history WHERE manga = ? AND rowid NOT IN "
+                        "(SELECT rowid FROM history WHERE manga = ? ORDER BY read_at DESC LIMIT ?)", (manga, manga, self.history_limit))
+
+    def migrate(self, source, settings):
+        """
+        import the positions of the QSettings settings (manga -> [volume, chapter, page]) once,
+        source identifies them (e.g. the ini file path), positions already in the store are kept
+        """
+        if self.db.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+            return
+
+        rows = []
+        for manga in settings.allKeys():
+            position = settings.value(manga)
+            if isinstance(position, list) and len(position) == 3:
+                rows.append((manga, json.dumps(position), 0))
+
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO progress (manga, position, read_at) VALUES (?, ?, ?)", rows)
+            self.db.execute("INSERT INTO migrations (source) VALUES (?)", (source,))
+        log.info("Migrated reading progress of %d mangas from %s", len(rows), source)
+
+    def copyTo(self, path):
+        """ write a consistent copy of the store to path """
+        self.flush()
+        target = sqlite3.connect(path)
+        try:
+            self.db.backup(target)
+        finally:
+            target.close()
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -0,0 +1,132 @@
+import os
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+
+from PyMangaLogger import log
+
+# characters unrar treats as wildcards in member names
+unrar_wildcards = "*?["
+
+class RarExtractCache(object):
+    """
+    Directory of rar members extracted in batches, shared by all Rar instances
+    Every archive gets its own subdirectory, the extracted files are bounded by a byte budget
+    and removed least recently used first, everything is removed at exit
+    """
+    root   = None # temp directory holding the archive directories, created on first use
+    tool   = None # path to the unrar executable, None disables the extraction
+    budget = 0    # max. bytes of all extracted files
+    used   = 0    # bytes of all extracted files
+    files  = None # path -> size, least recently used first
+
+    def __init__(self, budget = 0):
+        self.lock = threading.Lock()
+        self.files = OrderedDict()
+        self.budget = budget
+        atexit.register(self.cleanup)
+
+    def setBudget(self, budget):
+        with self.lock:
+            self.budget = max(0, budget)
+            self.evict()
+
+    def newArchiveDir(self):
+        """ creates an empty directory for the members of an archive """
+        with self.lock:
+            if self.root is None:
+                self.root = tempfile.mkdtemp(prefix="pymanga-rar-")
+            return tempfile.mkdtemp(dir=self.root)
+
+    def extract(self, archive, names, directory):
+        """
+        Extract the members names of the rar file archive into directory with a single unrar call
+        The names are recorded in the LRU in the given order, the last one counts as the most recently used
+        Names containing unrar wildcards are skipped
+        returns True if unrar succeeded
+        """
+        if not self.tool:
+            return False
+
+        # unrar matches the names as wildcard masks (also in list files), such names are left to rarfile
+        names = [name for name in names if not any(char in name for char in unrar_wildcards)]
+        if not names:
+            return False
+
+        # unrar wants native separators for member names and a trailing separator for the destination
+        members = [name.replace("/", os.sep).replace("\\", os.sep) for name in names]
+
+        # the names go through a list file (UTF-8, -scfl), so they never end up as arguments of unrar
+        try:
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".lst", delete=False) as listfile:
+                listfile.write("\n".join(members) + "\n")
+        except OSError as ex:
+            log.warning("Can't write the unrar list file: %s", ex)
+            return False
+        cmd = [self.tool, "x", "-y", "-o+", "-p-", "-idq", "-scfl", archive, "@" + listfile.name, directory + os.sep]
+
+        log.info("Extracting %d members of '%s' with one unrar call", len(names), archive)
+        try:
+            subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        except (OSError, subprocess.CalledProcessError) as ex:
+            log.warning("Batch extraction of '%s' failed: %s", archive, ex)
+            return False
+        finally:
+            os.remove(listfile.name)
+
+        with self.lock:
+            for member in members:
+                path = os.path.join(directory, member)
+                if os.path.isfile(path):
+                    size = os.path.getsize(path)
+                    old = self.files.pop(path, None)
+                    self.used += size - (old or 0)
+                    self.files[path] = size
+            self.evict()
+        return True
+
+    def read(self, path):
+        """ returns the content of the extracted file path or None if it isn't (anymore) extracted """
+        with self.lock:
+            if path not in self.files:
+                return None
+            self.files.move_to_end(path)
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except OSError:
+                self.used -= self.files.pop(path)
+                return None
+
+    def contains(self, path):
+        with self.lock:
+            return path in self.files
+
+    def removeArchiveDir(self, directory):
+        """ forget and delete everything extracted into directory """
+        with self.lock:
+            prefix = directory + os.sep
+            for path in [path for path in self.files if path.startswith(prefix)]:
+                self.used -= self.files.pop(path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def evict(self):
+        """ remove least recently used files until the budget fits, needs the lock """
+        while self.used > self.budget and self.files:
+            path, size = self.files.popitem(last=False)
+            self.used -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def cleanup(self):
+        with self.lock:
+            self.files.clear()
+            self.used = 0
+            if self.root:
+                shutil.rmtree(self.root, ignore_errors=True)
+                self.root = None
@@ -1,25 +1,31 @@
-import sys, os, threading, time
+import sys, os, time, math, json
+from collections import deque
 
-from ImageQt import ImageQt
+from ImageQt import toQPixmap
 from PIL import Image
 
-from PyQt5.QtCore import (QFile, QFileInfo, QPoint, QSettings, QSize, Qt, QTextStream, QEvent, pyqtSignal, QRect)
+from PyQt5.QtCore import (QFile, QFileInfo, QPoint, QSettings, QSize, Qt, QTextStream, QEvent, pyqtSignal, QRect, QTimer, QObject)
 from PyQt5.QtGui import (QIcon, QKeySequence, QImage, QPainter, QPalette, QPixmap, QTransform, QKeyEvent, QCursor, QFontMetrics, QFont, QColor)
-from PyQt5.QtWidgets import (QShortcut, QToolTip, QDialog, QComboBox, QLabel, QScrollArea, QAction, QApplication, QFileDialog, QMainWindow, QMessageBox, QTextEdit, QSizePolicy)
+from PyQt5.QtWidgets import (QShortcut, QToolTip, QDialog, QComboBox, QLabel, QScrollArea, QAction, QApplication, QFileDialog, QMainWindow, QMessageBox, QTextEdit, QSizePolicy, QListWidgetItem, QInputDialog)
 
 from ui_mainwindow import Ui_MainWindow
 from PyMangaSettings import *
 from PyMangaLayer import *
-from PyMangaLogger import log, setupLoggerFromCmdArgs
+from PyMangaPrefetch import Prefetcher
+from PyMangaPreprocess import openPreprocessed, setupPreprocessing, needsAnalysis, flushAdjustments
+from PyMangaScanner import LibraryScanner
+from PyMangaCache import PageCache, pixmapBytes
+from PyMangaRender import TiledImageView, rotate, rotatedSize
+from PyMangaStrip import StripView
+from PyMangaThumbs import Thumbnailer
+from PyMangaSequence import (PageSequence, PageLocator)
+from PyMangaTiming import timings, timed, markStartup, startup_marks
+from PyMangaTimingDialog import TimingDialog
+from PyMangaLogger import log, setupLoggerFromCmdArgs, setupProfilerFromCmdArgs
 from version import FULL_VERSION
 
 class NoElementsError(BaseException): pass
 
-def rotate(image, deg):
-    if not isinstance(image, Image.Image):
-        raise BaseException
-    return image.rotate(-deg) ## rotates ccw!
-
 class OrientationLabel(QLabel):
     rotation = 0
 
@@ -41,7 +47,7 @@ class OrientationLabel(QLabel):
         font.setBold(self.bold)
         font.setPointSize(self.pointsize)
 
-        log.info("FONT: %s " % (self.font.toString()))
+        log.debug("FONT: %s", self.font.toString())
 
         # Set default font
         painter.setFont(font)
@@ -59,7 +65,7 @@ class OrientationLabel(QLabel):
         # top
         if self.rotation == 0:
             painter.resetTransform()
-            center = QPoint( ( width - fm.width(text))/2, fm.height() )
+            center = QPoint( ( width - fm.width(text))//2, fm.height() )
             rectdimension = dim()
             painter.translate(center)
             painter.fillRect(rectdimension, Qt.white)
@@ -69,7 +75,7 @@ class OrientationLabel(QLabel):
         # right 
         if self.rotation == 90:
             painter.resetTransform()
-            center = QPoint( (height - fm.width(text))/2, - width + fm.height())
+            center = QPoint( (height - fm.width(text))//2, - width + fm.height())
             rectdimension = dim()
             painter.rotate(90)
             painter.translate(center)
@@ -80,7 +86,7 @@ class OrientationLabel(QLabel):
         # left
         if self.rotation == 270:
             painter.resetTransform()
-            center = QPoint(-height + (height - fm.width(text))/2, fm.height() )
+            center = QPoint(-height + (height - fm.width(text))//2, fm.height() )
             rectdimension = dim()
             painter.rotate(-90)
             painter.translate(center)
@@ -91,7 +97,7 @@ class OrientationLabel(QLabel):
         # bottom
         if self.rotation == 180:
             painter.resetTransform()
-            center = QPoint( -( width + fm.width(text))/2, -( height - fm.height()) )
+            center = QPoint( -( width + fm.width(text))//2, -( height - fm.height()) )
             rectdimension = dim()
             painter.rotate(180)
             painter.translate(center)
@@ -99,6 +105,70 @@ class OrientationLabel(QLabel):
             painter.drawRect(rectdimension)
             painter.drawText(QPoint(0, 0), text)
 
+class Toaster(QObject):
+    """
+    Shows messages on a toast label one after another, driven by a single-shot timer of the event loop
+    (nothing runs while no toast is shown and showing one never blocks)
+    A message stays at least min_duration ms before a queued one replaces it and duration ms if nothing follows,
+    repeating the shown or last queued message only extends it and at most max_queued messages wait
+    """
+    duration = 3000
+    min_duration = 600
+    max_queued = 2
+
+    def __init__(self, label):
+        super(Toaster, self).__init__(label)
+        self.label = label
+        self.queue = deque()    # messages waiting to be shown
+        self.current = None     # shown message
+        self.shown_at = 0       # time.monotonic() the current message was shown at
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.next)
+
+    def show(self, message):
+        if message == self.current and not self.queue:
+            self.timer.start(self.duration)
+            return
+        if self.queue and self.queue[-1] == message:
+            return
+
+        self.queue.append(message)
+        while len(self.queue) > self.max_queued:
+            self.queue.popleft()
+
+        if self.current is None:
+            self.next()
+        else:
+            # let the current message stay for min_duration before the next one replaces it
+            shown = (time.monotonic() - self.shown_at) * 1000
+            remaining = max(0, int(self.min_duration - shown))
+            if remaining < self.timer.remainingTime():
+                self.timer.start(remaining)
+
+    def next(self):
+        """ show the next queued message or hide the label if there is none """
+        if not self.queue:
+            log.info("Hiding toast")
+            self.current = None
+            self.label.hide()
+            return
+
+        self.current = self.queue.popleft()
+        self.shown_at = time.monotonic()
+        self.label.setText(self.current)
+        self.label.show()
+        self.label.raise_()
+        self.timer.start(self.min_duration if self.queue else self.duration)
+
+    def clear(self):
+        """ drop the shown and the queued messages """
+        self.queue.clear()
+        self.timer.stop()
+        self.current = None
+        self.label.hide()
+
 class DoubleClickLabel(QLabel):
     onDoubleClick = pyqtSignal()
 
@@ -115,15 +185,35 @@ WindowPassive = QEvent.WindowDeactivate
 
 class MainWindow(QMainWindow):
     manga_image = None  # holds the real image for display
+    manga_image_key = None # identifies the page in manga_image for the display cache
+    manga_image_layer = None # layer manga_image was loaded from, to decode it again at another size
+    manga_image_reduced = False # manga_image was decoded smaller than the original (see Layer.open)
     absolute_rotation = 0
     windowStatus = WindowPassive
     resize_mode = None
     scale_factor = 1.0
     zoomed = False
+    zoom_size = None # size of the zoomed page in display orientation, None if not zoomed
+    strip_mode = False # all pages of the chapter are shown below each other in the strip view
+    startup_pixmap = None # the page of the last session as it was shown, until the first page is loaded
+    startup_size = None # viewport size the startup_pixmap was taken at, it is only shown at that size
+    started = False     # the window was painted and the rest of the startup was kicked off
+    exit_after_startup = False # quit once the first page is shown (startup time measurement)
 
     manga_before = None # cache for last selected manga
+    sequence = None     # pages of the selected manga (PageSequence), navigation goes through it
     settings = None
 
+    prefetcher = None   # decodes the surrounding pages in the background
+    scanner = None      # scans the manga directories in the background
+    display_cache = None # scaled pixmaps per (page, size, rotation, resize mode)
+    thumbnailer = None  # loads the page thumbnails of the current chapter in the background
+    thumbnail_items = {} # layer key -> item in the thumbnail list
+    thumbnail_container = None # (manga key, path) of the container the thumbnail list shows the pages of
+    locator = None      # finds global page numbers in the background (jump to page)
+    awaited_page = None # layer of the page that is shown as soon as its prefetch finishes
+    page_turn = None    # (layer key, start time) of the page turn that is measured until the page is shown
+
     # dicts for the manga hierarchy
     manga_books = {}
     manga_vols = {}
@@ -136,7 +226,8 @@ class MainWindow(QMainWindow):
     dropdown_chapter = None
     dropdown_page = None
 
-    toast_thr = threading.Thread()
+    toaster = None      # shows the toast messages
+    timing_dialog = None # debug dialog with the page turn timings, created on first use
 
     shortcuts = dict()
 
@@ -155,6 +246,46 @@ class MainWindow(QMainWindow):
         self.settings = Settings(self)   # initialize and load settings from system
         self.resize_mode = Image.BICUBIC
 
+        # background decoding of the next/previous pages
+        self.prefetcher = Prefetcher(int(self.settings.settings[PREFETCH_AHEAD]), int(self.settings.settings[PREFETCH_BEHIND]))
+        self.prefetcher.imageReady.connect(self.onPagePrefetched)
+
+        # scaled pixmaps ready for display
+        self.display_cache = PageCache(int(self.settings.settings[DISPLAY_CACHE_SIZE]) * 1024 * 1024, pixmapBytes)
+
+        # renders the page in high quality once interactive resizing settles
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(150)
+        self.render_timer.timeout.connect(self.refreshMangaImage)
+
+        # background scanning of the manga directories
+        self.scanner = LibraryScanner(int(self.settings.settings[SCAN_TIMEOUT]))
+        self.scanner.found.connect(self.onMangasFound)
+        self.scanner.progress.connect(self.onScanProgress)
+        self.scanner.scanFinished.connect(self.onScanFinished)
+
+        # background thumbnails of the pages in the current chapter
+        self.thumbnailer = Thumbnailer()
+        self.thumbnailer.thumbnailReady.connect(self.onThumbnailReady)
+
+        # global page numbers may need all containers listed, that happens in the background
+        self.locator = PageLocator()
+        self.locator.indexLocated.connect(self.onPageIndexLocated)
+        self.locator.pageLocated.connect(self.onPageLocated)
+
+        # writes the recorded reading progress in batches
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setSingleShot(True)
+        self.progress_timer.setInterval(1000)
+        self.progress_timer.timeout.connect(self.settings.flushMangaSettings)
+
+        # coalesces the prefetch requests of a dropdown cascade into one
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(0)
+        self.prefetch_timer.timeout.connect(self.schedulePrefetch)
+
         # adjust tooltip font
         font = QGuiApplication.font()
         font.setPointSize(26)
@@ -168,6 +299,7 @@ class MainWindow(QMainWindow):
 
         self.toast_label = OrientationLabel("TOAST MESSAGE", self.ui.scrollArea)
         self.toast_label.hide()
+        self.toaster = Toaster(self.toast_label)
 
         self.manga_image_label = self.ui.manga_image_label
         self.manga_image_label = DoubleClickLabel()
@@ -182,6 +314,16 @@ class MainWindow(QMainWindow):
 
         self.scrollArea.setWidget(self.manga_image_label)
 
+        # zoomed pages are rendered tile by tile, the view replaces the image label in the scroll area while zoomed
+        self.zoom_view = TiledImageView(int(self.settings.settings[DISPLAY_CACHE_SIZE]) * 1024 * 1024)
+        self.zoom_view.onDoubleClick.connect(self.toggleFullscreen)
+
+        # in strip mode the strip view with all pages of the chapter replaces the image label in the scroll area
+        self.strip_view = StripView(self.scrollArea)
+        self.strip_view.onDoubleClick.connect(self.toggleFullscreen)
+        self.strip_view.pageChanged.connect(self.onStripPageChanged)
+        self.strip_view.pageShown.connect(self.onStripPageShown)
+
         # load previous window geometry
         geom = self.settings.load("geometry")
         if geom:
@@ -211,6 +353,15 @@ class MainWindow(QMainWindow):
         self.dropdown_chapter.currentIndexChanged.connect(self.loadPageFiles)
         self.dropdown_page   .currentIndexChanged.connect(self.loadPage)
 
+        # and thumbnail clicks
+        self.ui.thumbnail_list.setIconSize(QSize(self.thumbnailer.size, self.thumbnailer.size))
+        self.ui.thumbnail_list.itemClicked.connect(self.on_thumbnail_clicked)
+
+        # index of every name in the dropdown boxes and the position of their container in the page sequence (see fillDropdown)
+        for dropdown in [self.dropdown_manga, self.dropdown_volume, self.dropdown_chapter, self.dropdown_page]:
+            dropdown.positions = {}
+            dropdown.container = None
+
         # "Connect" dropdown box hierarchy for selecting e.g. the next volume if we are at the last page
         self.dropdown_volume.parent = None
         self.dropdown_volume.child = self.dropdown_chapter
@@ -219,20 +370,84 @@ class MainWindow(QMainWindow):
         self.dropdown_page.parent = self.dropdown_chapter
         self.dropdown_page.child = None
 
-        # load mangas in manga directory setting, needs self.dropdown_manga.currentIndexChanged to be connected
-        # also selects last viewed manga
-        self.loadMangaBooks()
-
-        # load previous image absolute rotation
+        # load previous image absolute rotation, applied to every loaded image
         rot = self.settings.load("absolute_rotation")
-        if rot is not None and self.manga_image is not None:
-            self.rotate(int(rot))
+        if rot is not None:
+            self.absolute_rotation = int(rot) % 360
+            self.toast_label.rotation = self.absolute_rotation
+
+        # load previous page mode
+        strip = self.settings.load("strip_mode")
+        if strip is not None:
+            self.strip_mode = int(strip) == 1
+
+        # show the last page of the previous session right away,
+        # scanning for mangas starts once the window is on screen (see paintEvent)
+        self.loadStartupSnapshot()
 
         # refresh GUI
         self.refreshGUI()
-        self.checkForEmptyMangas()
         self.connectShortcuts()
 
+    def startupSnapshotPath(self):
+        return os.path.join(os.path.dirname(self.settings.settings[MANGA_SETTINGS_PATH]), "manga_last_page.jpg")
+
+    def saveStartupSnapshot(self):
+        """
+        save the shown page as it is on screen, the next start shows it until the page itself is loaded
+        The viewport size and the page mode are saved with it, the snapshot is only shown if they are the same
+        """
+        position = [self.selectedManga(), self.selectedVolume(), self.selectedChapter(), self.selectedPage()]
+        viewport = self.scrollArea.viewport()
+        shown = self.scrollArea.widget() is self.strip_view or (self.manga_image is not None and self.scrollArea.widget() is self.manga_image_label)
+        if shown and viewport.grab().save(self.startupSnapshotPath(), "JPG", 85):
+            self.settings.store("startup_snapshot", json.dumps({"position": position, "size": [viewport.width(), viewport.height()], "strip_mode": self.strip_mode}))
+        else:
+            self.settings.store("startup_snapshot", "")
+
+    def loadStartupSnapshot(self):
+        """
+        show the snapshot of the last session if the last manga is still at the same position in the same page mode
+        The viewport size is only known once the window is laid out, it is compared in resizeEvent
+        """
+        try:
+            snapshot = json.loads(self.settings.load("startup_snapshot") or "{}")
+        except ValueError:
+            return
+        manga = self.settings.load("last_manga")
+        if not isinstance(snapshot, dict) or not manga or snapshot.get("strip_mode") != self.strip_mode:
+            return
+        if snapshot.get("position") != [manga] + (self.settings.loadMangaSettings(manga) or []):
+            return
+
+        pixmap = QPixmap()
+        if pixmap.load(self.startupSnapshotPath()):
+            self.startup_pixmap = pixmap
+            self.startup_size = tuple(snapshot.get("size", ()))
+            self.manga_image_label.setPixmap(pixmap)
+
+    def paintEvent(self, event):
+        super(MainWindow, self).paintEvent(event)
+        if self.started:
+            return
+        self.started = True
+        markStartup("first paint")
+        if self.startup_pixmap is not None:
+            markStartup("cached page")
+
+        # start scanning for mangas in manga directory setting, needs self.dropdown_manga.currentIndexChanged to be connected
+        # also selects last viewed manga as soon as it is found
+        # (the check for empty mangas happens when the scan is finished)
+        QTimer.singleShot(0, self.loadMangaBooks)
+
+    def onFirstPage(self):
+        """ the first page of the session is on screen """
+        markStartup("first page")
+        if self.exit_after_startup:
+            print(json.dumps(startup_marks))
+            sys.stdout.flush()
+            QTimer.singleShot(0, self.close)
+
     def connectShortcuts(self):
         """ Precondition: Shortcuts need to be already defined!! """
         self.settings.shortcuts["Rotate CW"].activated.connect(self.rotate_right)
@@ -267,6 +482,26 @@ class MainWindow(QMainWindow):
         unzoom.activated.connect(self.unzoom)
         self.shortcuts["unzoom"] = unzoom
 
+        jump = QShortcut(QKeySequence(Qt.Key_G), self)
+        jump.activated.connect(self.on_jump_to_page)
+        self.shortcuts["jump"] = jump
+
+        show_timings = QShortcut(QKeySequence(Qt.Key_T), self)
+        show_timings.activated.connect(self.on_show_timings)
+        self.shortcuts["timings"] = show_timings
+
+        strip_mode = QShortcut(QKeySequence(Qt.Key_W), self)
+        strip_mode.activated.connect(self.toggleStripMode)
+        self.shortcuts["strip_mode"] = strip_mode
+
+        auto_crop = QShortcut(QKeySequence(Qt.Key_C), self)
+        auto_crop.activated.connect(self.toggleAutoCrop)
+        self.shortcuts["auto_crop"] = auto_crop
+
+        auto_levels = QShortcut(QKeySequence(Qt.Key_L), self)
+        auto_levels.activated.connect(self.toggleAutoLevels)
+        self.shortcuts["auto_levels"] = auto_levels
+
     def setResizeModeNearest(self):
         self.resize_mode = Image.NEAREST
         self.showToast("Using resize mode 'NEAREST'")
@@ -331,39 +566,37 @@ class MainWindow(QMainWindow):
     # SETTINGS STUFF
     def saveMangaSettings(self, manga):
         """ save current selected volume/chapter/page for given manga """
-        log.info("Saving manga page settings for %s" % manga)
+        log.info("Saving manga page settings for %s", manga)
         self.settings.storeMangaSetting(manga, [self.selectedVolume(), self.selectedChapter(), self.selectedPage()])
 
+    def recordProgress(self):
+        """ record the shown page of the selected manga, written to disk within a second by progress_timer """
+        manga = self.selectedManga()
+        if manga and manga == self.manga_before:
+            self.saveMangaSettings(manga)
+            if not self.progress_timer.isActive():
+                self.progress_timer.start()
+
     def loadMangaSettings(self):
         """ select last viewed volume/chapter/manga for current manga """
-        log.info("Loading manga page settings for %s" % self.selectedManga())
+        log.info("Loading manga page settings for %s", self.selectedManga())
         manga_settings = self.settings.loadMangaSettings(self.selectedManga())
-        if manga_settings:
-            vol, chapter, page = manga_settings
-            try:
-                idx = self.dropdown_volume.findText(vol)
-                if idx == -1: idx = 0
-                self.selectEntry(self.dropdown_volume, idx)
 
-                idx = self.dropdown_chapter.findText(chapter)
-                if idx == -1: idx = 0
-                self.selectEntry(self.dropdown_chapter, idx)
-
-                idx = self.dropdown_page.findText(page)
-                if idx == -1: idx = 0
-                self.selectEntry(self.dropdown_page, idx)
-
-            except NoElementsError:
-                pass
+        # unknown volume/chapter/page names fall back to the first entry
+        path = self.sequence.first(manga_settings or [])
+        if path:
+            self.showPosition(path)
+        else:
+            # no pages, show what is there
+            self.load((), self.manga_vols, self.dropdown_volume)
 
     def loadLastSelectedManga(self):
         last_manga = self.settings.load("last_manga")
-        log.info("Loading last selected manga: %s" % last_manga)
+        log.info("Loading last selected manga: %s", last_manga)
         if last_manga:
             # select it!
-            idx = self.dropdown_manga.findText(last_manga)
+            idx = self.dropdown_manga.positions.get(last_manga, 0)
             currentIdx = self.selectedMangaIdx()
-            if idx == -1: idx = 0
             if idx != currentIdx:
                 self.dropdown_manga.setCurrentIndex(idx)
             else:
@@ -402,33 +635,76 @@ class MainWindow(QMainWindow):
             self.ui.page_label.show()
 
     def loadMangaBooks(self):
-        """ Scan each configured manga directory for top-level mangas """
+        """
+        Start scanning each configured manga directory for top-level mangas
+        A running scan is cancelled, the results arrive in onMangasFound
+        """
         # save the manga settings (selected volume/chapter/page) if there was a manga selected before
         if self.manga_before:
             self.saveMangaSettings(self.manga_before)
         self.manga_before = None # no manga selected, this practically disables saving [0,0,0] for last manga page settings
 
         self.clearMangaData()
+        self.clearImage()
+        self.manga_books = {}
+
+        self.dropdown_manga.currentIndexChanged.disconnect()
         self.dropdown_manga.clear()
+        self.dropdown_manga.positions = {}
+        self.dropdown_manga.currentIndexChanged.connect(self.loadVolumeFiles)
+
+        dirs = self.settings.settings[MANGA_DIRS]
+        self.ui.scan_progress.setMaximum(max(len(dirs), 1))
+        self.ui.scan_progress.setValue(0)
+        self.ui.scan_progress.show()
 
-        manga_list = []
-        for path in self.settings.settings[MANGA_DIRS]:
-            manga_names = os.listdir(os.path.abspath(path))
+        self.scanner.scan(dirs)
 
-            # save as (name, path) pairs
-            list = [(x, os.path.join(path, x)) for x in manga_names if isSupportedArchive(os.path.join(path, x))]
-            manga_list += list
+    def onMangasFound(self, generation, mangas):
+        """ Merge the mangas of a scanned directory into the manga dropdown """
+        if not self.scanner.isCurrent(generation):
+            return
 
-        # convert to dicts for easy lookup
-        self.manga_books = dict(manga_list)
+        # dict for easy lookup
+        self.manga_books.update(mangas)
 
-        # add the manga names to the manga dropdown
+        # insert the new names at their sorted position without triggering loadVolumeFiles,
+        # the selected manga stays selected
+        names = sorted(self.manga_books.keys(), key=naturalSortKey)
         self.dropdown_manga.currentIndexChanged.disconnect()
-        self.dropdown_manga.addItems(sorted([key for key, value in self.manga_books.items()]))
+        for idx, name in enumerate(names):
+            if idx >= self.dropdown_manga.count() or self.dropdown_manga.itemText(idx) != name:
+                self.dropdown_manga.insertItem(idx, name)
+        self.dropdown_manga.positions = dict((name, idx) for idx, name in enumerate(names))
         self.dropdown_manga.currentIndexChanged.connect(self.loadVolumeFiles)
 
-        self.loadLastSelectedManga()
-        #self.loadVolumeFiles()
+        # open the last selected manga as soon as it is found (if the user didn't select one in the meantime)
+        if not self.manga_before and self.settings.load("last_manga") in dict(mangas):
+            self.loadLastSelectedManga()
+
+        self.refreshGUI()
+
+    def onScanProgress(self, generation, done, total):
+        if self.scanner.isCurrent(generation):
+            self.ui.scan_progress.setMaximum(total)
+            self.ui.scan_progress.setValue(done)
+
+    def onScanFinished(self, generation):
+        if not self.scanner.isCurrent(generation):
+            return
+        self.ui.scan_progress.hide()
+
+        # last selected manga wasn't found, fall back to the default selection
+        if not self.manga_before:
+            self.loadLastSelectedManga()
+
+        # no page replaced the page of the last session
+        if self.startup_pixmap is not None:
+            self.startup_pixmap = None
+            self.refreshMangaImage()
+
+        self.refreshGUI()
+        self.checkForEmptyMangas()
 
     def loadVolumeFiles(self):
         """
@@ -454,11 +730,9 @@ class MainWindow(QMainWindow):
             self.clearImage() 
         else:
             manga_path = self.manga_books[selected]
-            log.info("Loading volume data from %s" % manga_path)
-
-            vol_layer = Layer(manga_path)
+            log.info("Loading volume data from %s", manga_path)
 
-            self.load(vol_layer, self.manga_vols, self.dropdown_volume)
+            self.sequence = PageSequence(Layer(manga_path))
             self.loadMangaSettings() # load last selected volume/chapter/page for current manga
 
     def loadChapterFiles(self):
@@ -478,10 +752,9 @@ class MainWindow(QMainWindow):
             # -> clear image
             self.clearImage()
         else:
-            chap_layer = self.manga_vols[selected]
-            log.info("Loading chapter data from %s" % chap_layer.path)
+            log.info("Loading chapter data from %s", self.manga_vols[selected].path)
 
-            self.load(chap_layer, self.manga_chaps, self.dropdown_chapter)
+            self.load((selected,), self.manga_chaps, self.dropdown_chapter)
     
     def loadPageFiles(self):
         """
@@ -498,35 +771,133 @@ class MainWindow(QMainWindow):
             # -> clear image
             self.clearImage()
         else:
-            page_layer = self.manga_chaps[selected]
-            log.info("Loading page data from %s" % page_layer.path)
+            log.info("Loading page data from %s", self.manga_chaps[selected].path)
 
-            self.load(page_layer, self.manga_pages, self.dropdown_page)
+            self.load((self.selectedVolume(), selected), self.manga_pages, self.dropdown_page)
 
-    def load(self, layer, store, dropdown):
+        self.refreshThumbnails()
+
+    def refreshThumbnails(self):
+        """
+        Show the thumbnails of the pages next to the current page (in the volume, chapter or manga, whichever holds it)
+        and select the current one, the list is only filled again if that container changed
         """
-        if the content of layer are other files:
+        path = self.currentPath()
+        page = self.sequence is not None and self.sequence.isPage(path)
+        container = (self.sequence.root.key, path[:-1]) if page else None
+        if container != self.thumbnail_container:
+            self.loadThumbnails(path[:-1] if page else None)
+            self.thumbnail_container = container
+
+        item = self.thumbnail_items.get(self.sequence.layer(path).key) if page else None
+        if item is not None:
+            self.ui.thumbnail_list.setCurrentItem(item)
+
+    def loadThumbnails(self, container):
+        """ Fill the thumbnail list with the pages in the container at path container (None for none), the thumbnails arrive one by one """
+        self.ui.thumbnail_list.clear()
+        self.thumbnail_items = {}
+        if container is None:
+            self.thumbnailer.cancel()
+            return
+
+        listing = self.sequence.children(container)
+        layers = []
+        for name in listing.names:
+            if not isImage(name):
+                continue
+            layer = listing.entries[name]
+            item = QListWidgetItem(name)
+            item.setSizeHint(QSize(self.thumbnailer.size + 8, self.thumbnailer.size + 24))
+            self.ui.thumbnail_list.addItem(item)
+            self.thumbnail_items[layer.key] = item
+            layers.append(layer)
+
+        self.thumbnailer.request(layers)
+
+    def onThumbnailReady(self, key, data):
+        item = self.thumbnail_items.get(key)
+        if item is None:
+            return
+
+        pixmap = QPixmap()
+        if pixmap.loadFromData(data):
+            item.setIcon(QIcon(pixmap))
+
+    def load(self, path, store, dropdown):
+        """
+        path is the position (names from the volume down) of a layer in the page sequence
+        if the content of the layer are other files:
             load the content into the store and dropdown box
-        if the content of layer is an image:
+        if the layer is an image:
             load the image and display it
         """
-        names_or_image = dict()
+        dropdown.positions = {}
         try:
-            names_or_image = layer.open()
+            if self.sequence.isPage(path):
+                self.refreshThumbnails()
+                self.openPage(self.sequence.layer(path))
+                self.recordProgress()
+            else:
+                self.fillDropdown(path, store, dropdown)
         except Exception as ex:
-            self.showToast("Failed loading %s\nMsg: %s" % (layer.path, ex))
+            self.showToast("Failed loading %s\nMsg: %s" % ("/".join(path), ex))
         else:
-            if isinstance(names_or_image, Image.Image):
-                self.loadImage(names_or_image)
-            elif isinstance(names_or_image, dict):
-                store.clear()
-                store.update(names_or_image) # (name, path) dict!
-
-                # add names to dropdown, was already cleared before
-                dropdown.addItems(sorted([key for key, value in store.items()]))
-           
             self.refreshGUI() # refresh the idx/count labels in front of the dropdowns
 
+    def fillDropdown(self, path, store, dropdown):
+        """ fill store and dropdown with the content of the container at path, listed only once by the page sequence """
+        listing = self.sequence.children(path)
+
+        store.clear()
+        store.update(listing.entries) # (name, layer) dict, already in natural order!
+
+        # remember the index of every name for selecting entries by name
+        dropdown.clear()
+        dropdown.positions = listing.positions
+        dropdown.container = path
+        dropdown.addItems(listing.names)
+
+    def currentPath(self):
+        """ position of the current selection in the page sequence (names of the selected volume/chapter/page) """
+        path = ()
+        for box in [self.dropdown_volume, self.dropdown_chapter, self.dropdown_page]:
+            if box.count() == 0 or box.currentIndex() == -1:
+                break
+            path += (box.currentText(),)
+        return path
+
+    def showPosition(self, path):
+        """
+        Select the page at path (names from the volume down to the page) in the dropdown boxes and show it
+        The boxes only reflect the position: they are refilled from the page sequence if their container changed
+        and don't go through the currentIndexChanged cascade, so only the page itself is opened
+        """
+        boxes = [(self.dropdown_volume, self.manga_vols), (self.dropdown_chapter, self.manga_chaps), (self.dropdown_page, self.manga_pages)]
+        try:
+            for depth, (box, store) in enumerate(boxes):
+                box.blockSignals(True)
+                try:
+                    if depth < len(path):
+                        if box.count() == 0 or box.container != path[:depth]:
+                            self.fillDropdown(path[:depth], store, box)
+                        box.setCurrentIndex(box.positions[path[depth]])
+                    elif box.count() > 0:
+                        store.clear()
+                        box.clear()
+                        box.positions = {}
+                finally:
+                    box.blockSignals(False)
+
+            self.refreshThumbnails()
+
+            self.openPage(self.sequence.layer(path))
+            self.recordProgress()
+        except Exception as ex:
+            self.showToast("Failed loading %s\nMsg: %s" % ("/".join(path), ex))
+
+        self.refreshGUI()
+
     def loadPage(self, idx = None):
         """
         Open the image for the current selected page
@@ -537,33 +908,240 @@ class MainWindow(QMainWindow):
             self.clearImage()
             return
 
+        self.refreshThumbnails()
+
         # open selected page
         image_layer = self.manga_pages[self.selectedPage()]  
         try:
-            image = image_layer.open()
-            self.loadImage(image)
+            self.openPage(image_layer)
+            self.recordProgress()
         except BaseException as ex:
             self.showToast("Failed loading %s" % image_layer.path)
 
         self.refreshGUI()
 
-    def loadImage(self, image):
-        """ Load an image of type Image """
+    def openPage(self, layer):
+        """
+        Show the page of the image layer
+        Takes the image from the prefetcher if possible, waits for it if it is being prefetched right now
+        and decodes it directly otherwise. Pages that need a preprocessing analysis first are decoded by the prefetcher
+        """
+        self.awaited_page = None
+        if self.strip_mode:
+            self.showStrip()
+            return
+
+        self.prefetch_timer.start()
+
+        size = self.decodeSizeHint()
+        image = self.prefetcher.get(layer.key, size)
+        if image is None:
+            if self.prefetcher.isPending(layer.key):
+                # shown by onPagePrefetched
+                self.awaited_page = layer
+                return
+            if needsAnalysis(layer):
+                # the analysis (and the NumPy import) happens in a worker, shown by onPagePrefetched
+                self.prefetcher.request(layer, size)
+                self.awaited_page = layer
+                return
+            image = openPreprocessed(layer, size)
+
+        self.loadImage(image, layer.key, layer)
+
+    def showStrip(self):
+        """ show the pages next to the selected page in the strip view, scrolled to the selected page """
+        self.startup_pixmap = None
+        if self.scrollArea.widget() is not self.strip_view:
+            self.scrollArea.takeWidget()
+            self.scrollArea.setWidgetResizable(False) # the strip view is as high as all pages together
+            self.scrollArea.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn) # the strip width doesn't change when scrolling becomes possible
+            self.scrollArea.setWidget(self.strip_view)
+
+        path = self.currentPath()
+        listing = self.sequence.children(path[:-1])
+        pages = [(name, listing.entries[name]) for name in listing.names if isImage(name)]
+
+        self.strip_view.setPages((self.sequence.root.key, path[:-1]), pages)
+        self.fitStrip()
+        self.strip_view.scrollToPage([name for name, layer in pages].index(path[-1]))
+
+    def fitStrip(self):
+        """ fit the strip view into the width of the scroll area """
+        self.strip_view.fit(self.scrollArea.viewport().width(), self.absolute_rotation, self.resize_mode)
+
+    def onStripPageShown(self, index):
+        if "first page" not in startup_marks:
+            self.onFirstPage()
+
+    def onStripPageChanged(self, index):
+        """ Select the page at the top of the strip view in the dropdown boxes without opening it """
+        path = self.currentPath()
+        if self.sequence is None or not self.sequence.isPage(path):
+            return
+
+        # the page is in the deepest box with a selection
+        box = [self.dropdown_volume, self.dropdown_chapter, self.dropdown_page][len(path) - 1]
+        box.blockSignals(True)
+        box.setCurrentIndex(box.positions[self.strip_view.names[index]])
+        box.blockSignals(False)
+
+        self.refreshThumbnails()
+        self.recordProgress()
+        self.refreshGUI()
+
+    def toggleStripMode(self):
+        """ switch between single pages and continuous scrolling through all pages of the chapter (long strips) """
+        self.resetZoom()
+        self.strip_mode = not self.strip_mode
+
+        if self.strip_mode:
+            self.prefetcher.cancel()
+            self.showToast("Continuous scrolling")
+        else:
+            self.strip_view.clear()
+            self.scrollArea.takeWidget()
+            self.scrollArea.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+            self.scrollArea.setWidget(self.manga_image_label)
+            self.scrollArea.setWidgetResizable(True)
+            self.showToast("Single pages")
+
+        path = self.currentPath()
+        if self.sequence is not None and self.sequence.isPage(path):
+            try:
+                self.openPage(self.sequence.layer(path))
+            except Exception as ex:
+                log.warning("Failed loading %s: %s", "/".join(path), ex)
+                self.showToast("Failed loading %s\nMsg: %s" % ("/".join(path), ex))
+        self.refreshMangaImage()
+
+    def toggleAutoCrop(self):
+        """ switch cropping the white/black margins of the pages on/off """
+        self.settings.settings[AUTO_CROP] = 0 if int(self.settings.settings[AUTO_CROP]) else 1
+        self.showToast("Cropping page margins" if self.settings.settings[AUTO_CROP] else "Showing page margins")
+        self.refreshPreprocessing()
+
+    def toggleAutoLevels(self):
+        """ switch stretching the gray levels of the pages on/off """
+        self.settings.settings[AUTO_LEVELS] = 0 if int(self.settings.settings[AUTO_LEVELS]) else 1
+        self.showToast("Auto levels" if self.settings.settings[AUTO_LEVELS] else "Original levels")
+        self.refreshPreprocessing()
+
+    def refreshPreprocessing(self):
+        """ apply the preprocessing settings and show the page again with them (the strip view isn't preprocessed) """
+        setupPreprocessing(int(self.settings.settings[AUTO_CROP]), int(self.settings.settings[AUTO_LEVELS]), self.settings.settings[LEVELS_GAMMA])
+        self.display_cache.clear()
+
+        path = self.currentPath()
+        if not self.strip_mode and self.sequence is not None and self.sequence.isPage(path):
+            try:
+                self.openPage(self.sequence.layer(path))
+            except Exception as ex:
+                log.warning("Failed loading %s: %s", "/".join(path), ex)
+                self.showToast("Failed loading %s\nMsg: %s" % ("/".join(path), ex))
+
+    def onPagePrefetched(self, key):
+        """ Show the awaited page once the prefetcher is done with it """
+        layer = self.awaited_page
+        if layer is None or layer.key != key:
+            return
+        self.awaited_page = None
+
+        size = self.decodeSizeHint()
+        image = self.prefetcher.get(key, size)
+        try:
+            if image is None:
+                # prefetch failed or was decoded for another size/preprocessing, try again (without a new analysis)
+                image = openPreprocessed(layer, size, analyze=False)
+            self.loadImage(image, key, layer)
+        except BaseException as ex:
+            self.showToast("Failed loading %s" % layer.path)
+
+        self.refreshGUI()
+
+    def schedulePrefetch(self):
+        """ Prefetch the pages around the current position """
+        path = self.currentPath()
+        if self.sequence is None or not self.sequence.isPage(path):
+            self.prefetcher.cancel()
+            return
+
+        self.prefetcher.schedule(self.sequence, path, self.sequence.layer(path).key, self.decodeSizeHint())
+
+    def decodeSizeHint(self):
+        """
+        Size pages need to be decoded at for fitting them into the image label,
+        in image orientation (before rotation) and rounded up to steps of 128 pixels
+        so small viewport changes reuse already decoded pages
+        returns None (full size) if the label has no usable size yet
+        """
+        width = self.manga_image_label.size().width()
+        height = self.manga_image_label.size().height()
+        if width <= 0 or height <= 0:
+            return None
+
+        if self.absolute_rotation in (90, 270):
+            width, height = height, width
+
+        step = 128
+        return (int(math.ceil(width / step)) * step, int(math.ceil(height / step)) * step)
+
+    def reloadMangaImage(self, size):
+        """ Decode the shown page again for size (None for full size), the display stays untouched """
+        if self.manga_image_layer is None:
+            return False
+
+        try:
+            image = openPreprocessed(self.manga_image_layer, size, analyze=False)
+        except Exception as ex:
+            log.warning("Failed reloading %s: %s", self.manga_image_layer.path, ex)
+            return False
+
+        if not isinstance(image, Image.Image):
+            return False
+
+        self.manga_image = image
+        self.manga_image_reduced = isReducedImage(image)
+        return True
+
+    def loadImage(self, image, key = None, layer = None):
+        """
+        Load an image of type Image
+        key identifies the page for the display cache, images without key are never served from it
+        layer is the layer the image was loaded from (for decoding it again at another size),
+        its cache key (with the file modification time) replaces key, so replaced files aren't served stale
+        """
         if not isinstance(image, Image.Image):
             return
 
         # if the image is not empty
         if not image is None:
             # convert to qpixmap and save in internal buffer
-            self.manga_image = rotate(image, self.absolute_rotation)
+            self.manga_image = image
+            if layer is not None:
+                key = layer.cacheKey() or key
+            self.manga_image_key = key if key is not None else object()
+            self.manga_image_layer = layer
+            self.manga_image_reduced = isReducedImage(image)
+            self.startup_pixmap = None
+            self.resetZoom()
 
             # trigger resizing (includes setting/showing the image)
             self.refreshMangaImage()
 
+            if self.page_turn and layer is not None:
+                if self.page_turn[0] == layer.key:
+                    timings.record("page turn", time.perf_counter() - self.page_turn[1])
+                self.page_turn = None
+
     # CLEARER
     def clearImage(self):
         """ Clear the current image """
+        self.awaited_page = None
         self.manga_image = None
+        self.manga_image_layer = None
+        self.strip_view.clear()
+        self.resetZoom()
         self.refreshMangaImage()
 
     def clearMangaData(self):
@@ -576,12 +1154,18 @@ class MainWindow(QMainWindow):
         self.dropdown_chapter.clear()
         self.dropdown_volume.clear()
 
+        # messages about the manga before (e.g. failed pages) don't belong to the next one
+        self.toaster.clear()
+
     # HELPER
     def rotate(self, deg):
-        """ Rotate image by deg, always relative to the rotation before """
+        """
+        Rotate image by deg, always relative to the rotation before
+        The rotation is applied when displaying, manga_image itself is never rotated
+        """
         self.absolute_rotation = (self.absolute_rotation + deg) % 360
         self.toast_label.rotation = self.absolute_rotation # update toast label rotation
-        self.manga_image = rotate(self.manga_image, deg);
+        self.resetZoom()
         self.refreshMangaImage()
 
     def refreshMangaImage(self):
@@ -667,61 +1251,102 @@ class MainWindow(QMainWindow):
             combobox.setCurrentIndex(new_idx)
             return True
 
-    def toast(self, label, duration):
-        sleep_step = 0.01
+    def showToast(self, message):
+        self.toaster.show(message)
 
-        log.info("Showing toast for %d seconds" % duration)
-        label.show()
-        while not self.stop_toast and duration > 0:
-            time.sleep(sleep_step)
-            duration -= sleep_step
-        label.hide()
-        log.info("Hiding toast")
+    def displayedImageSize(self):
+        """ size of manga_image in display orientation (after rotation) """
+        return rotatedSize(self.manga_image.size, self.absolute_rotation)
 
-    def showToast(self, message):
-        while self.toast_thr and self.toast_thr.is_alive():
-            self.stop_toast = True
-            self.toast_thr.join()
+    def fittedImageSize(self):
+        """ size of the rotated manga_image scaled to fit into the image label """
+        maxwidth  = self.manga_image_label.size().width()
+        maxheight = self.manga_image_label.size().height()
 
-        self.toast_label.setText(message)
+        width, height = self.displayedImageSize()
+        ratio = min(maxwidth/width, maxheight/height)
 
-        self.stop_toast = False
-        self.toast_thr = threading.Thread(target=self.toast, args=(self.toast_label, 3))
-        self.toast_thr.start()
+        return (max(int(width*ratio), 1), max(int(height*ratio), 1))
+
+    def renderMangaImage(self, size, resize_mode = None):
+        """
+        resample manga_image to size (display orientation) with the current resize mode, returns a QPixmap
+        The rotation is applied losslessly to the already scaled image
+        """
+        if resize_mode is None:
+            resize_mode = self.resize_mode
+
+        with timed("resize"):
+            pic = self.manga_image.resize(rotatedSize(size, self.absolute_rotation), resize_mode)
+            # or PIL.Image.NEAREST
+            # or PIL.Image.BILINEAR
+            # or PIL.Image.BICUBIC
+            # or PIL.Image.ANTIALIAS (for downsampling?)
+        with timed("rotate"):
+            pic = rotate(pic, self.absolute_rotation)
+
+        # convert PIL.Image to QPixmap
+        with timed("ImageQt"):
+            return toQPixmap(pic)
 
     # EVENT HANDLER
     def resizeEvent(self, event):
-        """ Fit manga image into the image label """
+        """
+        Fit manga image into the image label
+        Scaled pixmaps are cached per (page, size, rotation, resize mode)
+        While the window is interactively resized (event is given) the shown pixmap is only stretched
+        and the high quality resample happens once resizing settles
+        """
         # force an geometry update for all widgets
         self.geometryUpdateHack()
         
         # resize toast label
-        self.toast_label.resize(self.manga_image_label.size())
+        self.toast_label.resize(self.scrollArea.viewport().size())
 
-        # resize manga image only if it is not empty
-        pic = self.manga_image
-        if pic is None:
-            pic = QPixmap()
-        else:
-            maxwidth  = self.manga_image_label.size().width()
-            maxheight = self.manga_image_label.size().height()
+        viewport = self.scrollArea.viewport()
+        if self.startup_pixmap is not None and self.isVisible() and self.startup_size != (viewport.width(), viewport.height()):
+            # the page of the last session was taken at another window size, it would be shown unscaled
+            self.startup_pixmap = None
+            self.manga_image_label.setPixmap(QPixmap())
 
-            width = pic.size[0]
-            height = pic.size[1]
-            ratio = min(maxwidth/width, maxheight/height)
+        if self.strip_mode:
+            self.render_timer.stop()
+            self.fitStrip()
+            return
 
-            pic = self.manga_image.resize((int(width*ratio), int(height*ratio)), self.resize_mode)
-            # or PIL.Image.NEAREST
-            # or PIL.Image.BILINEAR
-            # or PIL.Image.BICUBIC
-            # or PIL.Image.ANTIALIAS (for downsampling?)
+        # resize manga image only if it is not empty, the page of the last session stays until the first page is loaded
+        if self.manga_image is None:
+            self.render_timer.stop()
+            self.manga_image_label.setPixmap(self.startup_pixmap or QPixmap())
+            return
 
-            # convert PIL.Image to QPixmap
-            self.___cached_data = ImageQt(pic) # to prevent python to clean the data up that qpixmap references :I
-            pic = QPixmap.fromImage(self.___cached_data)
+        size = self.fittedImageSize()
+        key = (self.manga_image_key, size, self.absolute_rotation, self.resize_mode)
 
-        # update label with scaled pixmap (or empty pixmap)
-        self.manga_image_label.setPixmap(pic)
+        pic = self.display_cache.get(key)
+        if pic is None:
+            shown = self.manga_image_label.pixmap()
+            if event is not None and shown is not None and not shown.isNull():
+                # cheap preview, replaced by refreshMangaImage when the timer fires
+                pic = shown.scaled(size[0], size[1], Qt.IgnoreAspectRatio, Qt.FastTransformation)
+                self.render_timer.start()
+            else:
+                # the page was decoded for a smaller viewport
+                displayed = self.displayedImageSize()
+                if self.manga_image_reduced and (size[0] > displayed[0] or size[1] > displayed[1]):
+                    self.reloadMangaImage(self.decodeSizeHint())
+                    size = self.fittedImageSize()
+                    key = (self.manga_image_key, size, self.absolute_rotation, self.resize_mode)
+
+                pic = self.renderMangaImage(size)
+                self.display_cache.put(key, pic)
+
+        # update label with scaled pixmap
+        with timed("pixmap set"):
+            self.manga_image_label.setPixmap(pic)
+
+        if "first page" not in startup_marks:
+            self.onFirstPage()
 
     def closeEvent(self, event):
         """ Close the window but save settings before that! """
@@ -730,12 +1355,23 @@ class MainWindow(QMainWindow):
 
         # save absolute image rotation
         self.settings.store("absolute_rotation", self.absolute_rotation)
+        self.settings.store("strip_mode", int(self.strip_mode))
+        self.saveStartupSnapshot()
         
         # save last vol/chap/page for current manga
         self.saveMangaSettings(self.selectedManga())
 
         # save general settings (manga dirs, manga settings path, ...)
         self.settings.save()
+        self.settings.flushMangaSettings()
+
+        # wait for running prefetches and scans
+        self.prefetcher.shutdown()
+        self.scanner.shutdown()
+        self.thumbnailer.shutdown()
+        self.locator.shutdown()
+        self.strip_view.shutdown()
+        flushAdjustments()
 
         QMainWindow.closeEvent(self, event);
             
@@ -768,9 +1404,11 @@ class MainWindow(QMainWindow):
     def on_settings(self):
         """ Show settings dialog """
         if self.settings.execDialog():
+            # restarts the scan, checks for empty mangas when done
             self.loadMangaBooks()
+        else:
+            self.checkForEmptyMangas()
         self.refreshGUI()
-        self.checkForEmptyMangas()
 
     def on_about(self):
         """ Show about box """
@@ -799,65 +1437,89 @@ class MainWindow(QMainWindow):
     def rotate_left(self):
         self.rotate(-90)
 
-    def pageflipPrev(self):
-        self.resetZoom()
+    def pageflip(self, step):
+        """ go step (1 or -1) pages forward/backward in the page sequence, across chapter and volume boundaries """
+        path = self.currentPath()
+        if self.sequence is None or not self.sequence.isPage(path):
+            return
 
-        # go to previous page
-        # if the page-list doesn't have any entries then try to go to the previous "chapter"
-        # if the chapter-list doesn't have any entries then try to go to the previous "volume"
-        boxes = [self.dropdown_page, self.dropdown_chapter, self.dropdown_volume]
-        for box in boxes:
-            try:
-                if self.selectEntry(box, -1) == False:
-                    # already at first entry in box -> try to decrement its parents until one can be decremented
-                    # and show toast with info
-                    cur_box = box.parent
-
-                    while cur_box and self.selectEntry(cur_box, -1) == False:
-                        cur_box = cur_box.parent
-                    if cur_box == None:
-                        self.showToast("Already at first page of the Manga!")
-                        break
-                    else:
-                        self.showToast("Prev: %s" % cur_box.currentText())
-                else:
-                    cur_box = box
-
-                # also select last entry in each child boxes
-                # cur_box is the dropdown box that was sucessfully decremented without going over bounds
-                cur_box = cur_box.child
-                while cur_box and self.selectEntry(cur_box, cur_box.count() - 1) == True:
-                    cur_box = cur_box.child
+        if self.strip_mode and self.strip_view.names:
+            # scroll through the strip, go on with the neighbouring chapter at its ends
+            if self.strip_view.scrollPage(step):
+                return
+            path = path[:-1] + (self.strip_view.names[-1 if step > 0 else 0],)
+
+        try:
+            target = self.sequence.neighbour(path, step)
+        except Exception as ex:
+            self.showToast("Failed loading %s\nMsg: %s" % ("/".join(path), ex))
+            return
+
+        if target is None:
+            self.showToast("Already at %s page of the Manga!" % ("last" if step > 0 else "first"))
+            return
 
+        # show toast with the name of the volume/chapter that was entered
+        for depth in range(min(len(path), len(target)) - 1):
+            if path[depth] != target[depth]:
+                self.showToast("%s: %s" % ("Next" if step > 0 else "Prev", target[depth]))
                 break
-            except NoElementsError:
-                continue
+
+        # measured until the page is shown (see loadImage), also if it has to wait for its prefetch
+        if not self.strip_mode:
+            self.page_turn = (self.sequence.layer(target).key, time.perf_counter())
+        self.showPosition(target)
+
+    def pageflipPrev(self):
+        self.resetZoom()
+        self.pageflip(-1)
 
     def pageflipNext(self):
         self.resetZoom()
+        self.pageflip(1)
 
-        # go to next page
-        # if the page-list doesn't have any entries then try to go to the next "chapter"
-        # if the chapter-list doesn't have any entries then try to go to the next "volume"
-        boxes = [self.dropdown_page, self.dropdown_chapter, self.dropdown_volume]
-        for box in boxes:
-            try:
-                if self.selectEntry(box, 1) == False:
-                    # already at last entry in box -> try to advance its parents until one can be advanced
-                    # and show toast with info
-                    cur_box = box.parent
-
-                    while cur_box and self.selectEntry(cur_box, 1) == False:
-                        cur_box = cur_box.parent
-                    if cur_box == None:
-                        self.showToast("Already at last page of the Manga!")
-                        break
-                    else:
-                        self.showToast("Next: %s" % cur_box.currentText())
+    def jumpToPage(self, index):
+        """ show the page with the (0-based) index in the whole manga, once it is found (see onPageLocated) """
+        if self.sequence is None:
+            return
+        self.locator.locatePage(self.sequence, index)
 
-                break
-            except NoElementsError:
-                continue
+    def onPageLocated(self, sequence, index, path, count):
+        if sequence is not self.sequence:
+            return
+        if path is None:
+            self.showToast("The Manga has only %d pages!" % count)
+            return
+        self.resetZoom()
+        self.showPosition(path)
+
+    def on_jump_to_page(self):
+        """ asks for the page to jump to, once the number of the current page is known (see onPageIndexLocated) """
+        if self.sequence is None:
+            return
+        self.locator.locateIndex(self.sequence, self.currentPath())
+
+    def onPageIndexLocated(self, sequence, path, current):
+        if sequence is not self.sequence or path != self.currentPath():
+            return
+        page, ok = QInputDialog.getInt(self, "Go to page", "Page of the Manga:", (current or 0) + 1, 1, 1000000)
+        if ok:
+            self.jumpToPage(page - 1)
+
+    def on_show_timings(self):
+        """ show the debug dialog with the page turn timings """
+        if self.timing_dialog is None:
+            self.timing_dialog = TimingDialog(self)
+        self.timing_dialog.show()
+        self.timing_dialog.raise_()
+
+    def on_thumbnail_clicked(self, item):
+        """ select the page of the thumbnail in the box holding the current page """
+        path = self.currentPath()
+        if self.sequence is None or not self.sequence.isPage(path):
+            return
+        box = [self.dropdown_volume, self.dropdown_chapter, self.dropdown_page][len(path) - 1]
+        box.setCurrentIndex(box.positions[item.text()])
 
     def on_navigate_to_prev_manga(self):
         self.selectEntry(self.dropdown_manga, -1)
@@ -873,29 +1535,36 @@ class MainWindow(QMainWindow):
         return super().event(event)
 
     def scaleImage(self, factor):
+        """
+        Zoom the shown page by factor
+        The zoomed page is shown by the tiled zoom view, which only resamples the visible tiles
+        """
+        # the strip view always fits the width
+        if self.manga_image is None or self.strip_mode:
+            return
+
         scale_factor = self.scale_factor
         if scale_factor < 0.3 or scale_factor > 2:
             return
         scale_factor *= factor;
 
-        self.scrollArea.setWidgetResizable(False) # honors the manga_image_label size         
+        size = self.zoom_size or self.fittedImageSize()
+        size = (max(int(size[0] * scale_factor), 1), max(int(size[1] * scale_factor), 1))
 
-        image_size = self.manga_image_label.pixmap().size()
-        scaled_image_size = image_size * scale_factor
+        # the page was decoded for fitting into the window, zooming needs the details of the full image
+        displayed = self.displayedImageSize()
+        if self.manga_image_reduced and (size[0] > displayed[0] or size[1] > displayed[1]):
+            self.reloadMangaImage(None)
 
-        # manga_image is a PIL.Image, use biliniear filter for speed
-        pic = self.manga_image.resize((scaled_image_size.width(), scaled_image_size.height()), Image.BILINEAR)
-        
-        # convert PIL.Image to QPixmap
-        self.___cached_data = ImageQt(pic) # to prevent python to clean the data up that qpixmap references :I
-        pic = QPixmap.fromImage(self.___cached_data)
+        self.showZoomView()
+        self.zoom_size = size
 
-        # update label with scaled pixmap (or empty pixmap)
-        self.manga_image_label.setPixmap(pic)
+        # manga_image is a PIL.Image, use biliniear filter for speed
+        self.zoom_view.setView(self.manga_image, self.manga_image_key, self.absolute_rotation, size, Image.BILINEAR)
 
-        # adjust size of the image label (but minimum is scrollArea size!) to let the scrollArea create scrollbars
-        w = max(scaled_image_size.width(), self.scrollArea.size().width())
-        h = max(scaled_image_size.height(), self.scrollArea.size().height())
+        # adjust size of the zoom view (but minimum is scrollArea size!) to let the scrollArea create scrollbars
+        w = max(size[0], self.scrollArea.size().width())
+        h = max(size[1], self.scrollArea.size().height())
 
         if w > self.scrollArea.size().width():
             #log.info("Showing horizontal scrollbar")
@@ -907,11 +1576,18 @@ class MainWindow(QMainWindow):
             #log.info("Showing vertical scrollbar")
             w -= 17 # self.scrollArea.verticalScrollBar().size().width()
 
-        self.manga_image_label.resize(w, h)
+        self.zoom_view.resize(w, h)
 
         adjustScrollBar(self.scrollArea.horizontalScrollBar(), factor);
         adjustScrollBar(self.scrollArea.verticalScrollBar(), factor);
 
+    def showZoomView(self):
+        """ put the zoom view into the scroll area, the image label is kept for unzooming """
+        if self.scrollArea.widget() is not self.zoom_view:
+            self.scrollArea.setWidgetResizable(False) # honors the zoom_view size
+            self.scrollArea.takeWidget()
+            self.scrollArea.setWidget(self.zoom_view)
+
     def zoom(self):
         self.scaleImage(1.1)
     
@@ -920,18 +1596,29 @@ class MainWindow(QMainWindow):
 
     def resetZoom(self):
         self.scale_factor = 1.0
-        self.scrollArea.setWidgetResizable(True)
+        self.zoom_size = None
+        if self.scrollArea.widget() is self.zoom_view:
+            self.scrollArea.takeWidget()
+            self.zoom_view.clear()
+            self.scrollArea.setWidget(self.manga_image_label)
+            self.scrollArea.setWidgetResizable(True)
+            self.refreshMangaImage()
 
 
 def adjustScrollBar(scrollBar, factor):
     scrollBar.setValue(int(factor * scrollBar.value() + ((factor - 1) * scrollBar.pageStep()/2)));
 
 if __name__ == '__main__':
+    markStartup("imports")
     setupLoggerFromCmdArgs(sys.argv)
+    setupProfilerFromCmdArgs(sys.argv)
 
     try:
         app = QApplication(sys.argv)
         mainWin = MainWindow()
+        markStartup("window")
+        # --startup-timing: print the startup milestones as JSON and quit once the first page is shown
+        mainWin.exit_after_startup = "--startup-timing" in sys.argv
         mainWin.show()
         sys.exit(app.exec_())
     except Exception as ex:
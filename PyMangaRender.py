@@ -0,0 +1,166 @@
+from collections import OrderedDict
+
+from PIL import Image
+from PyQt5.QtCore import (Qt, QRect, QTimer, pyqtSignal)
+from PyQt5.QtGui import (QPainter)
+from PyQt5.QtWidgets import (QWidget)
+
+from ImageQt import toQPixmap
+from PyMangaCache import PageCache, pixmapBytes
+
+# lossless transposes for rotating clockwise by multiples of 90 degrees
+rotate_transposes = {
+    90: Image.ROTATE_270, ## transpose rotates ccw!
+    180: Image.ROTATE_180,
+    270: Image.ROTATE_90
+}
+
+def rotate(image, deg):
+    if not isinstance(image, Image.Image):
+        raise BaseException
+    deg %= 360
+    if deg == 0:
+        return image
+    if deg in rotate_transposes:
+        return image.transpose(rotate_transposes[deg])
+    return image.rotate(-deg, expand=True) ## rotates ccw!
+
+def rotatedSize(size, deg):
+    """ size of an image with size after rotating it by deg (multiple of 90) """
+    if deg % 180 == 90:
+        return (size[1], size[0])
+    return size
+
+def unrotatedRect(x, y, w, h, size, deg):
+    """
+    maps the rect (x, y, w, h) of an image that was rotated clockwise by deg
+    back to the image before the rotation, size is the unrotated image size
+    """
+    width, height = size
+    if deg == 90:
+        return (y, height - x - w, h, w)
+    if deg == 180:
+        return (width - x - w, height - y - h, w, h)
+    if deg == 270:
+        return (width - y - h, x, h, w)
+    return (x, y, w, h)
+
+TILE_SIZE = 256
+
+class TiledImageView(QWidget):
+    """
+    Shows a zoomed PIL image in a scroll area by rendering only the tiles that get painted
+    Tiles are cached per zoom level. Missing tiles are drawn with a fast nearest neighbor resample first
+    and replaced one by one with the selected resize filter while the event loop is idle
+    """
+    onDoubleClick = pyqtSignal()
+
+    image       = None  # unrotated source PIL.Image
+    image_key   = None  # identifies the page for the tile cache
+    rotation    = 0
+    size        = None  # (width, height) of the zoomed image in display orientation
+    resize_mode = Image.BILINEAR
+
+    def __init__(self, budget):
+        super(TiledImageView, self).__init__()
+        self.setStyleSheet("background-color: rgb(0, 0, 0);")
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+        self.tiles = PageCache(budget, pixmapBytes)
+        self.queue = OrderedDict() # tiles waiting for the high quality render, most recently painted last
+
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(0)
+        self.render_timer.timeout.connect(self.renderQueued)
+
+    def setView(self, image, key, rotation, size, resize_mode):
+        """ show image rotated by rotation and zoomed to size (display orientation) """
+        if image is not self.image or key != self.image_key or rotation != self.rotation:
+            self.tiles.clear()
+
+        self.image = image
+        self.image_key = key
+        self.rotation = rotation
+        self.size = size
+        self.resize_mode = resize_mode
+        self.queue.clear()
+        self.update()
+
+    def clear(self):
+        self.image = None
+        self.tiles.clear()
+        self.queue.clear()
+        self.render_timer.stop()
+
+    def offset(self):
+        """ the zoomed image is centered if it is smaller than the widget """
+        return (max(0, (self.width() - self.size[0]) // 2), max(0, (self.height() - self.size[1]) // 2))
+
+    def tileRect(self, tx, ty):
+        x, y = tx * TILE_SIZE, ty * TILE_SIZE
+        return (x, y, min(TILE_SIZE, self.size[0] - x), min(TILE_SIZE, self.size[1] - y))
+
+    def renderTile(self, tx, ty, resize_mode):
+        """ resample only the part of the source image that ends up in tile (tx, ty) """
+        x, y, w, h = self.tileRect(tx, ty)
+        unrotated = rotatedSize(self.size, self.rotation)
+        ux, uy, uw, uh = unrotatedRect(x, y, w, h, unrotated, self.rotation)
+
+        fx = self.image.size[0] / unrotated[0]
+        fy = self.image.size[1] / unrotated[1]
+        box = (ux * fx, uy * fy, (ux + uw) * fx, (uy + uh) * fy)
+
+        tile = self.image.resize((uw, uh), resize_mode, box=box)
+        return toQPixmap(rotate(tile, self.rotation))
+
+    def tileKey(self, tx, ty, hq):
+        return (self.size, self.rotation, tx, ty, hq)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), Qt.black)
+        if self.image is None:
+            return
+
+        ox, oy = self.offset()
+        visible = event.rect().translated(-ox, -oy).intersected(QRect(0, 0, self.size[0], self.size[1]))
+        if visible.isEmpty():
+            return
+
+        for ty in range(visible.top() // TILE_SIZE, visible.bottom() // TILE_SIZE + 1):
+            for tx in range(visible.left() // TILE_SIZE, visible.right() // TILE_SIZE + 1):
+                pixmap = self.tiles.get(self.tileKey(tx, ty, True))
+                if pixmap is None:
+                    # fast preview, the high quality tile follows
+                    pixmap = self.tiles.get(self.tileKey(tx, ty, False))
+                    if pixmap is None:
+                        pixmap = self.renderTile(tx, ty, Image.NEAREST)
+                        self.tiles.put(self.tileKey(tx, ty, False), pixmap)
+                    self.queue[(tx, ty)] = None
+                    self.queue.move_to_end((tx, ty))
+                painter.drawPixmap(ox + tx * TILE_SIZE, oy + ty * TILE_SIZE, pixmap)
+
+        if self.queue:
+            self.render_timer.start()
+
+    def renderQueued(self):
+        """ render one queued tile in high quality, reschedules itself until the queue is empty """
+        if not self.queue or self.image is None:
+            return
+
+        (tx, ty), _ = self.queue.popitem()
+        key = self.tileKey(tx, ty, True)
+        if self.tiles.get(key) is None:
+            self.tiles.put(key, self.renderTile(tx, ty, self.resize_mode))
+
+        ox, oy = self.offset()
+        x, y, w, h = self.tileRect(tx, ty)
+        self.update(ox + x, oy + y, w, h)
+
+        if self.queue:
+            self.render_timer.start()
+
+    def mouseDoubleClickEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.onDoubleClick.emit()
@@ -0,0 +1,131 @@
+import os
+
+from PyQt5.QtCore import (QObject, QRunnable, QThreadPool, QTimer, pyqtSignal)
+
+from PyMangaLogger import log
+from PyMangaLayer import *
+
+class ScanTask(QRunnable):
+    """ lists one manga base directory in a worker thread """
+
+    def __init__(self, scanner, generation, path):
+        super(ScanTask, self).__init__()
+        self.scanner = scanner
+        self.generation = generation
+        self.path = path
+
+    def run(self):
+        if not self.scanner.isCurrent(self.generation):
+            log.info("Library scan %d cancelled", self.generation)
+            return
+
+        try:
+            # the entry types come from os.scandir, no stat call per entry
+            entries = listDirectory(os.path.abspath(self.path))
+        except Exception as ex:
+            # e.g. OSError or a library index error, the directory still counts as scanned
+            log.warning("Failed scanning manga directory '%s': %s", self.path, ex)
+            entries = []
+
+        # save as (name, path) pairs
+        mangas = [(name, os.path.join(self.path, name)) for name, isdir in entries if isSupportedEntry(name, isdir)]
+        self.scanner.listed.emit(self.generation, self.path, mangas)
+
+class LibraryScanner(QObject):
+    """
+    Scans the manga base directories for top-level mangas in the background
+    All directories are listed concurrently, results are reported per directory as they arrive
+    through the signals, tagged with the generation of the scan
+    A directory that takes longer than timeout seconds (e.g. an unreachable network share) counts as done,
+    so it doesn't hold back the end of the scan; its mangas are still merged if they arrive later
+    Starting a new scan cancels the running one
+    """
+    found = pyqtSignal(int, object)         # generation, list of (name, path) pairs
+    progress = pyqtSignal(int, int, int)    # generation, scanned directories, total directories
+    scanFinished = pyqtSignal(int)          # generation
+
+    # internal, emitted from the worker threads
+    listed = pyqtSignal(int, object, object) # generation, directory, list of (name, path) pairs
+
+    timeout = 10    # seconds until a directory counts as timed out
+    threads = 4     # directories listed at the same time
+
+    def __init__(self, timeout = 10, threads = 4):
+        super(LibraryScanner, self).__init__()
+        self.generation = 0
+        self.timeout = timeout
+        self.threads = threads
+        self.total = 0          # number of directories of the current scan
+        self.pending = set()    # directories of the current scan that didn't report yet
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+
+        self.timeout_timer = QTimer(self)
+        self.timeout_timer.setSingleShot(True)
+        self.timeout_timer.timeout.connect(self.onTimeout)
+
+        self.listed.connect(self.onListed)
+
+    def scan(self, dirs):
+        """ (re)start scanning dirs, returns the generation of the new scan """
+        self.generation += 1
+        log.info("Starting library scan %d", self.generation)
+
+        dirs = list(dict.fromkeys(dirs)) # without duplicates, in order
+        self.total = len(dirs)
+        self.pending = set(dirs)
+
+        # directories stuck in a hanging mount keep their thread, the others shouldn't wait for them
+        self.pool.setMaxThreadCount(max(self.threads, self.pool.activeThreadCount() + min(self.threads, len(dirs))))
+        for path in dirs:
+            self.pool.start(ScanTask(self, self.generation, path))
+
+        if dirs:
+            self.timeout_timer.start(int(self.timeout * 1000))
+        else:
+            self.timeout_timer.stop()
+            QTimer.singleShot(0, lambda generation = self.generation: self.finish(generation))
+        return self.generation
+
+    def cancel(self):
+        self.generation += 1
+        self.pending = set()
+        self.timeout_timer.stop()
+
+    def isCurrent(self, generation):
+        return generation == self.generation
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.clear()
+        # don't hang on exit because of an unreachable mount
+        self.pool.waitForDone(int(self.timeout * 1000))
+
+    def onListed(self, generation, path, mangas):
+        if not self.isCurrent(generation):
+            return
+
+        if path not in self.pending:
+            log.warning("Manga directory '%s' answered after the timeout", path)
+            self.found.emit(generation, mangas)
+            return
+
+        self.pending.discard(path)
+        self.found.emit(generation, mangas)
+        self.progress.emit(generation, self.total - len(self.pending), self.total)
+        if not self.pending:
+            self.finish(generation)
+
+    def onTimeout(self):
+        for path in self.pending:
+            log.warning("Scanning manga directory '%s' timed out after %d seconds", path, self.timeout)
+        self.pending = set()
+
+        self.progress.emit(self.generation, self.total, self.total)
+        self.finish(self.generation)
+
+    def finish(self, generation):
+        if self.isCurrent(generation):
+            self.timeout_timer.stop()
+            self.scanFinished.emit(generation)
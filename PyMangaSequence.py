@@ -0,0 +1,250 @@
+import threading
+
+from PyQt5.QtCore import (QObject, QRunnable, QThreadPool, pyqtSignal)
+
+from PyMangaLogger import log
+from PyMangaLayer import *
+
+class Listing(object):
+    """ content of a container layer: names in natural order, name -> Layer and name -> index """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.names = list(entries.keys())
+        self.positions = dict((name, idx) for idx, name in enumerate(self.names))
+
+class PageSequence(object):
+    """
+    Flat view of all pages of a manga (series)
+    Positions are paths of names from the manga down to the page, e.g. (volume, chapter, page),
+    at most depth names deep like the dropdown boxes (volume, chapter, page)
+    Every container is listed at most once, the global page index is extended lazily as far as it is needed
+    Used from the GUI thread and the prefetch workers, lock only guards the data, containers are listed outside of it
+    Extending the global index may list many containers, so it belongs in a worker (see PageLocator)
+    """
+    root  = None # Layer of the manga
+    depth = 3    # max. length of a page path
+
+    def __init__(self, root, depth = 3):
+        self.root = root
+        self.depth = depth
+        self.lock = threading.RLock()
+        self.extend_lock = threading.Lock() # one extender at a time, held while listing
+        self.listings = {}      # container path -> Listing
+        self.pages = []         # page paths in series order, as far as known
+        self.indices = {}       # page path -> index in pages
+        self.complete = False   # pages holds all pages of the series
+        self.extender = None    # generator extending pages
+
+    def children(self, path):
+        """ returns the Listing of the container at path, raises if it can't be opened """
+        with self.lock:
+            listing = self.listings.get(path)
+            if listing is not None:
+                return listing
+
+        layer = self.layer(path)
+        content = layer.open()
+        listing = Listing(content if isinstance(content, dict) else {})
+
+        with self.lock:
+            return self.listings.setdefault(path, listing)
+
+    def layer(self, path):
+        """ returns the Layer at path """
+        if not path:
+            return self.root
+        return self.children(path[:-1]).entries[path[-1]]
+
+    def isPage(self, path):
+        return len(path) > 0 and isImage(path[-1])
+
+    def descend(self, path, step):
+        """ generator over the page paths inside the container at path (or path itself if it is a page) """
+        if self.isPage(path):
+            yield path
+            return
+        if len(path) >= self.depth:
+            return
+
+        try:
+            names = self.children(path).names
+        except Exception as ex:
+            log.warning("Page sequence: failed listing '%s': %s", "/".join(path), ex)
+            return
+
+        for name in (names if step > 0 else reversed(names)):
+            yield from self.descend(path + (name,), step)
+
+    def walk(self, path, step):
+        """
+        generator over the page paths following path (step 1) or before path (step -1),
+        crossing chapter and volume boundaries
+        """
+        for depth in reversed(range(len(path))):
+            listing = self.children(path[:depth])
+            idx = listing.positions.get(path[depth])
+            if idx is None:
+                return
+            idx += step
+            while 0 <= idx < len(listing.names):
+                yield from self.descend(path[:depth] + (listing.names[idx],), step)
+                idx += step
+
+    def neighbour(self, path, step):
+        """ page path step pages (1 or -1) away from path or None at the start/end of the series """
+        return next(self.walk(path, step), None)
+
+    def first(self, names):
+        """
+        page path for the (possibly outdated) names of a saved position
+        unknown names are replaced by the first entry on their level
+        returns None if there are no pages at all
+        """
+        path = ()
+        for name in names:
+            if self.isPage(path) or len(path) >= self.depth:
+                break
+            try:
+                listing = self.children(path)
+            except Exception as ex:
+                log.warning("Page sequence: failed listing '%s': %s", "/".join(path), ex)
+                return None
+            if not listing.names:
+                break
+            path += (name if name in listing.positions else listing.names[0],)
+
+        if self.isPage(path):
+            return path
+
+        # the position is a container (or an empty one), take the next page from there
+        page = next(self.descend(path, 1), None)
+        if page is None and path:
+            page = next(self.walk(path, 1), None)
+        return page
+
+    def extend(self, count = 1):
+        """ append the next count pages to the global index, returns False once all pages are known """
+        with self.extend_lock:
+            if self.complete:
+                return False
+            if self.extender is None:
+                self.extender = self.descend((), 1)
+
+            # listing the containers happens outside the lock, readers of the known pages don't wait for it
+            found = []
+            for i in range(count):
+                path = next(self.extender, None)
+                if path is None:
+                    break
+                found.append(path)
+
+            with self.lock:
+                for path in found:
+                    self.indices[path] = len(self.pages)
+                    self.pages.append(path)
+                if len(found) < count:
+                    self.complete = True
+                return not self.complete
+
+    def index(self, path):
+        """ global index of the page path in the series or None if it isn't part of it """
+        while True:
+            with self.lock:
+                if path in self.indices or self.complete:
+                    return self.indices.get(path)
+            self.extend(64)
+
+    def page(self, index):
+        """ page path with the global index or None if the series has fewer pages """
+        while True:
+            with self.lock:
+                if 0 <= index < len(self.pages):
+                    return self.pages[index]
+                if self.complete or index < 0:
+                    return None
+            self.extend(64)
+
+    def count(self):
+        """ number of pages in the series, lists all containers """
+        while self.extend(64):
+            pass
+        with self.lock:
+            return len(self.pages)
+
+class LocateTask(QRunnable):
+    """ finds the global index of a page path (path given) or the page path of a global index in a worker thread """
+
+    def __init__(self, locator, generation, sequence, path = None, index = None):
+        super(LocateTask, self).__init__()
+        self.locator = locator
+        self.generation = generation
+        self.sequence = sequence
+        self.path = path
+        self.index = index
+
+    def run(self):
+        # request isn't wanted anymore
+        if self.generation != self.locator.generation:
+            return
+
+        try:
+            if self.path is not None:
+                self.locator.indexFound.emit(self.generation, self.sequence, self.path, self.sequence.index(self.path))
+            else:
+                path = self.sequence.page(self.index)
+                count = self.sequence.count() if path is None else 0
+                self.locator.pageFound.emit(self.generation, self.sequence, self.index, path, count)
+        except Exception as ex:
+            log.warning("Page sequence: failed locating page: %s", ex)
+
+class PageLocator(QObject):
+    """
+    Resolves global page indices (see PageSequence.index/page) in a worker thread, so listing the containers
+    it takes doesn't block the GUI. A new request drops the outstanding one
+    """
+    indexLocated = pyqtSignal(object, object, object)   # sequence, page path, global index or None
+    pageLocated = pyqtSignal(object, int, object, int)  # sequence, global index, page path or None, page count if there is no such page
+
+    # internal, emitted from the worker thread
+    indexFound = pyqtSignal(int, object, object, object)
+    pageFound = pyqtSignal(int, object, int, object, int)
+
+    def __init__(self):
+        super(PageLocator, self).__init__()
+        self.generation = 0 # incremented on every request, drops the results of the one before
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(1)
+
+        self.indexFound.connect(self.onIndexFound)
+        self.pageFound.connect(self.onPageFound)
+
+    def locateIndex(self, sequence, path):
+        """ report the global index of the page path in sequence through indexLocated """
+        self.start(LocateTask(self, self.generation + 1, sequence, path = path))
+
+    def locatePage(self, sequence, index):
+        """ report the page path with the global index in sequence through pageLocated """
+        self.start(LocateTask(self, self.generation + 1, sequence, index = index))
+
+    def start(self, task):
+        self.generation += 1
+        self.pool.clear()
+        self.pool.start(task)
+
+    def cancel(self):
+        self.generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def onIndexFound(self, generation, sequence, path, index):
+        if generation == self.generation:
+            self.indexLocated.emit(sequence, path, index)
+
+    def onPageFound(self, generation, sequence, index, path, count):
+        if generation == self.generation:
+            self.pageLocated.emit(sequence, index, path, count)
@@ -10,23 +10,41 @@ from PyQt5.QtWidgets import (QShortcut)
 from PyMangaSettingsDialog import *
 from PyMangaLogger import log
 from PyMangaLayer import *
+from PyMangaDecoders import setupDecoders
+from PyMangaPreprocess import setupPreprocessing
+from PyMangaProgress import ProgressStore
 
 # application tags
 COMPANY = "jschmer"
 APPLICATION = "PyMangaReader"
 
+def progressPath(settings_path):
+    """ the reading progress is stored next to the manga settings file """
+    return os.path.join(os.path.dirname(settings_path), "manga_progress.sqlite")
+
 class Settings():
     """ Settings class for storing and retrieving settings """
     # the default application settings
     settings = {
                 MANGA_DIRS : [],
                 MANGA_SETTINGS_PATH : os.path.dirname(os.path.realpath(__file__)) + "/manga_settings.ini",
-                UNRAR_EXE : "unrar"
+                UNRAR_EXE : "unrar",
+                PREFETCH_AHEAD : 3,  # pages decoded in advance after the current one
+                PREFETCH_BEHIND : 1, # pages kept decoded before the current one
+                PAGE_CACHE_SIZE : 256, # memory budget for decoded pages in MB
+                DISPLAY_CACHE_SIZE : 64, # memory budget for scaled pages ready for display in MB
+                ARCHIVE_POOL_SIZE : 16, # max. number of archives kept open
+                RAR_CACHE_SIZE : 512, # disk budget for batch extracted rar pages in MB
+                SCAN_TIMEOUT : 10, # seconds until a slow manga directory doesn't hold back the library scan
+                AUTO_CROP : 0, # crop white/black page margins (toggled with C)
+                AUTO_LEVELS : 0, # stretch the gray levels of washed-out pages (toggled with L)
+                LEVELS_GAMMA : 1.0 # gamma applied together with the auto levels
                }
 
     # the QSettings objects
     appsettings = None
-    mangasettings = None
+    mangasettings = None # legacy ini file of the reading progress, read for the migration and used if the store isn't accessible
+    progress = None      # reading progress store
 
     # shortcuts/hotkeys
     shortcuts = None
@@ -70,7 +88,36 @@ class Settings():
     def refreshMangaSettings(self):
         # load manga specific settings from MANGA_SETTINGS_PATH as ini file
         self.mangasettings = QSettings(self.settings[MANGA_SETTINGS_PATH], QSettings.IniFormat)
+        self.setupProgressStore()
         setupUnrar(self.settings[UNRAR_EXE])
+        setupPageCache(self.settings[PAGE_CACHE_SIZE])
+        setupArchivePool(self.settings[ARCHIVE_POOL_SIZE])
+        setupRarCache(self.settings[RAR_CACHE_SIZE])
+        setupLibraryIndex(os.path.join(os.path.dirname(self.settings[MANGA_SETTINGS_PATH]), "manga_index.sqlite"))
+        setupDecoders(os.path.join(os.path.dirname(self.settings[MANGA_SETTINGS_PATH]), "manga_decoders.json"))
+        setupPreprocessing(int(self.settings[AUTO_CROP]), int(self.settings[AUTO_LEVELS]), self.settings[LEVELS_GAMMA])
+
+    def setupProgressStore(self):
+        """
+        (re)open the reading progress store and import the positions of the ini file once
+        If the store isn't accessible, the positions are read from and written to the ini file like before
+        """
+        path = progressPath(self.settings[MANGA_SETTINGS_PATH])
+        if self.progress and self.progress.path == path:
+            return
+        if self.progress:
+            self.progress.close()
+            self.progress = None
+
+        progress = None
+        try:
+            progress = ProgressStore(path)
+            progress.migrate(self.settings[MANGA_SETTINGS_PATH], self.mangasettings)
+            self.progress = progress
+        except Exception as ex:
+            log.warning("Reading progress store not accessible: %s (%s), using %s", path, ex, self.settings[MANGA_SETTINGS_PATH])
+            if progress:
+                progress.db.close()
 
     def save(self):
         """ save application settings into system """
@@ -91,9 +138,13 @@ class Settings():
             newpath = dialog.settings[MANGA_SETTINGS_PATH]
 
             # copy old file to new location if newpath doesn't exist
-            if oldpath != newpath and not os.path.exists(newpath):
+            if oldpath != newpath and os.path.exists(oldpath) and not os.path.exists(newpath):
                 copy(oldpath, newpath)
 
+            # same for the reading progress
+            if self.progress and progressPath(oldpath) != progressPath(newpath) and not os.path.exists(progressPath(newpath)):
+                self.progress.copyTo(progressPath(newpath))
+
             self.settings = dialog.settings
             self.refreshMangaSettings()
 
@@ -112,7 +163,19 @@ class Settings():
         return self.appsettings.value(tag)
 
     def storeMangaSetting(self, manga, value):
-        self.mangasettings.setValue(manga, value)
+        """ record the position value ([volume, chapter, page]) in manga, written by flushMangaSettings """
+        if self.progress:
+            self.progress.record(manga, value)
+        else:
+            self.mangasettings.setValue(manga, value)
 
     def loadMangaSettings(self, manga):
-        return self.mangasettings.value(manga)
\ No newline at end of file
+        if self.progress:
+            return self.progress.lookup(manga)
+        return self.mangasettings.value(manga)
+
+    def flushMangaSettings(self):
+        if self.progress:
+            self.progress.flush()
+        else:
+            self.mangasettings.sync()
\ No newline at end of file
@@ -5,13 +5,21 @@ from PyQt5.QtCore import (Qt)
 from PyQt5.QtWidgets import (QDialog, QFileDialog)
 
 from PyMangaLayer import *
-from ui_settings import Ui_SettingsDialog
-from PyMangaHotkeySettings import HotkeyDialog
 
 # setting tags
 MANGA_DIRS = "mangadirs"
 MANGA_SETTINGS_PATH = "mangasettingspath"
 UNRAR_EXE = "unrarexepath"
+PREFETCH_AHEAD = "prefetchahead"
+PREFETCH_BEHIND = "prefetchbehind"
+PAGE_CACHE_SIZE = "pagecachesize"
+DISPLAY_CACHE_SIZE = "displaycachesize"
+ARCHIVE_POOL_SIZE = "archivepoolsize"
+RAR_CACHE_SIZE = "rarcachesize"
+SCAN_TIMEOUT = "scantimeout"
+AUTO_CROP = "autocrop"
+AUTO_LEVELS = "autolevels"
+LEVELS_GAMMA = "levelsgamma"
 
 class SettingsDialog(QDialog):
 
@@ -26,7 +34,8 @@ class SettingsDialog(QDialog):
         self.settings = settings
         self.shortcuts = shortcuts
 
-        # Set up the user interface from Designer.
+        # Set up the user interface from Designer (imported here, the dialog isn't needed for starting up)
+        from ui_settings import Ui_SettingsDialog
         self.ui = Ui_SettingsDialog()
         self.ui.setupUi(self)
 
@@ -81,5 +90,6 @@ class SettingsDialog(QDialog):
         self.ui.labelUnrarExe.setText(self.settings[UNRAR_EXE])
 
     def execHotkey(self):
+        from PyMangaHotkeySettings import HotkeyDialog
         dialog = HotkeyDialog(self.shortcuts)
         dialog.exec_()
\ No newline at end of file
@@ -0,0 +1,163 @@
+import io
+import mmap
+import shutil
+import struct
+import tempfile
+import zipfile
+
+from PyMangaLogger import log
+
+class MemberFile(io.RawIOBase):
+    """
+    Seekable read-only view of the byte range [offset, offset + size) of a root file
+    root is either a path (the view opens its own handle), a mmap object or a memoryview
+    Used to open archives stored inside other archives and stored pages without reading them into memory
+    """
+    root   = None # path or mmap the range lives in
+    offset = 0    # start of the range in root
+    size   = 0    # length of the range
+    pos    = 0    # current position relative to offset
+
+    def __init__(self, root, offset, size):
+        super(MemberFile, self).__init__()
+        self.root = root
+        self.offset = offset
+        self.size = size
+        self.pos = 0
+        self.handle = open(root, "rb") if isinstance(root, str) else None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += self.size
+        if pos < 0:
+            raise ValueError("negative seek position %d" % pos)
+        self.pos = pos
+        return self.pos
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), self.size - self.pos))
+        if count == 0:
+            return 0
+
+        start = self.offset + self.pos
+        if self.handle:
+            self.handle.seek(start)
+            count = self.handle.readinto(memoryview(buffer)[:count])
+        else:
+            buffer[:count] = self.root[start:start + count]
+
+        self.pos += count
+        return count
+
+    def read(self, size = -1):
+        if self.handle:
+            return super(MemberFile, self).read(size)
+
+        # mapped roots are sliced directly, without the intermediate buffer of RawIOBase.read
+        start = self.pos
+        end = self.size if size is None or size < 0 else min(self.size, start + size)
+        if end <= start:
+            return b""
+        self.pos = end
+        return bytes(self.root[self.offset + start:self.offset + end])
+
+    def readall(self):
+        if self.handle:
+            return super(MemberFile, self).readall()
+        return self.read()
+
+    def close(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+        if isinstance(self.root, memoryview):
+            # the archive mapping can only be unmapped once no slice of it is left
+            self.root.release()
+        super(MemberFile, self).close()
+
+def rootRange(file):
+    """
+    returns (root, offset) for a Zip source: a path, a MemberFile or a mmap
+    so nested views always read from the outermost file directly
+    """
+    if isinstance(file, MemberFile):
+        return file.root, file.offset
+    return file, 0
+
+def isStoredMember(info):
+    """ True if the zip member info is neither compressed nor encrypted (its data can be read as is) """
+    return info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1
+
+def memberDataOffset(header, base, info):
+    """ offset of the data of member info, header holds its local file header, base the offset of the archive """
+    # the data starts behind the local file header, which has its own name/extra field lengths
+    fields = struct.unpack(zipfile.structFileHeader, header)
+    return base + info.header_offset + zipfile.sizeFileHeader + fields[zipfile._FH_FILENAME_LENGTH] + fields[zipfile._FH_EXTRA_FIELD_LENGTH]
+
+def storedMemberFile(zip, info):
+    """ view on the data of the uncompressed member info in the zipfile.ZipFile zip (see Zip.file) """
+    root, base = rootRange(zip.file)
+
+    header = MemberFile(root, base + info.header_offset, zipfile.sizeFileHeader)
+    try:
+        offset = memberDataOffset(header.read(zipfile.sizeFileHeader), base, info)
+    finally:
+        header.close()
+
+    return MemberFile(root, offset, info.file_size)
+
+def mapArchive(file):
+    """
+    Map the outermost file of a Zip source (see rootRange) read-only into memory
+    returns (memoryview over the mapping, offset of the source in it)
+    or (None, 0) if the source can't be mapped (empty files, in-memory streams)
+    """
+    root, base = rootRange(file)
+    if isinstance(root, str):
+        try:
+            with open(root, "rb") as f:
+                root = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as ex:
+            log.warning("Can't map '%s' into memory: %s", root, ex)
+            return None, 0
+
+    if not isinstance(root, mmap.mmap):
+        return None, 0
+    return memoryview(root), base
+
+def mappedMemberFile(view, base, info):
+    """
+    stream over the data of the uncompressed member info as slice of view (see mapArchive)
+    The member isn't read up front, read() copies just the requested bytes out of the mapping
+    The mapping is unmapped once the archive and all member streams are closed
+    """
+    start = base + info.header_offset
+    offset = memberDataOffset(view[start:start + zipfile.sizeFileHeader], base, info)
+    data = view[offset:offset + info.file_size]
+    return MemberFile(data, 0, len(data))
+
+def spillToMap(stream):
+    """
+    Extract stream into an anonymous temp file and map it into memory
+    returns a MemberFile over the mapping, random access without keeping a heap copy
+    """
+    with tempfile.TemporaryFile(prefix="pymanga") as temp:
+        shutil.copyfileobj(stream, temp, 1024 * 1024)
+        temp.flush()
+        size = temp.tell()
+        if size == 0:
+            # empty files can't be mapped
+            return io.BytesIO()
+        log.info("Extracted %d bytes into a temp file", size)
+        return MemberFile(mmap.mmap(temp.fileno(), 0, access=mmap.ACCESS_READ), 0, size)
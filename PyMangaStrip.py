@@ -0,0 +1,303 @@
+from bisect import bisect_right
+
+from PIL import Image
+from PyQt5.QtCore import (Qt, QRect, QRunnable, QThreadPool, pyqtSignal)
+from PyQt5.QtGui import (QPainter, QPixmap, QColor)
+from PyQt5.QtWidgets import (QWidget)
+
+from ImageQt import ImageQt
+from PyMangaLogger import log
+from PyMangaLayer import pageDimensions
+from PyMangaRender import rotate, rotatedSize
+
+# height/width ratio of the placeholders as long as no page size of the strip is known
+default_aspect = 1.5
+
+# decoded pages are only limited in width, this stands in for "any height"
+unlimited = 1 << 16
+
+def stripHeight(size, width, rotation):
+    """ height of a page with size (unrotated) in a strip of width after rotating it by rotation """
+    shown = rotatedSize(size, rotation)
+    return max(1, int(round(width * shown[1] / shown[0])))
+
+class MeasureTask(QRunnable):
+    """ reads the sizes of the pages of a strip (library index or image headers) in chunks in a worker thread """
+    chunk = 32
+
+    def __init__(self, view, generation, layers):
+        super(MeasureTask, self).__init__()
+        self.view = view
+        self.generation = generation
+        self.layers = layers
+
+    def run(self):
+        for start in range(0, len(self.layers), self.chunk):
+            # other pages are shown by now
+            if self.generation != self.view.generation:
+                return
+            chunk = self.layers[start:start + self.chunk]
+            try:
+                sizes = pageDimensions(chunk)
+            except Exception as ex:
+                # unknown sizes keep the placeholder height until the pages are rendered
+                log.warning("Strip: failed measuring pages: %s", ex)
+                sizes = [None] * len(chunk)
+            self.view.measured.emit(self.generation, start, sizes)
+
+class RenderTask(QRunnable):
+    """ decodes one page of a strip and scales it to the strip width in a worker thread """
+
+    def __init__(self, view, key, index, layer):
+        super(RenderTask, self).__init__()
+        self.view = view
+        self.key = key
+        self.index = index
+        self.layer = layer
+
+    def run(self):
+        image = None
+        size = None
+        # page scrolled out of reach or the strip changed meanwhile
+        if self.key == self.view.renderKey() and self.index in self.view.wanted:
+            generation, width, rotation, resize_mode = self.key
+            try:
+                # only decoded as large as needed for the strip width
+                page = self.layer.open((unlimited, width) if rotation % 180 == 90 else (width, unlimited))
+                size = page.info.get("original_size", page.size)
+                page = page.resize(rotatedSize((width, stripHeight(size, width, rotation)), rotation), resize_mode)
+                image = ImageQt(rotate(page, rotation))
+            except Exception as ex:
+                log.warning("Strip: failed rendering '%s': %s", self.layer.path, ex)
+        self.view.rendered.emit(self.key, self.index, image, size)
+
+class StripView(QWidget):
+    """
+    Shows all pages of a chapter below each other, fitted to the width of the scroll area (long strip webtoons)
+    Only the pages near the viewport are decoded and scaled in a worker pool, the pixmaps of pages further away
+    are dropped again, so the memory use depends on the viewport and not on the length of the chapter
+    The page sizes for the layout come from the library index (read from the image headers once),
+    pages of still unknown size borrow the size of the page before, the page at the top of the viewport
+    stays in place when the layout changes
+    """
+    onDoubleClick = pyqtSignal()
+    pageChanged = pyqtSignal(int) # index of the page at the top of the viewport after scrolling
+    pageShown = pyqtSignal(int)   # index of a page whose rendered pixmap was just put into the viewport
+
+    # internal, emitted from the worker threads
+    measured = pyqtSignal(int, int, object)             # generation, index of the first page, list of sizes
+    rendered = pyqtSignal(object, int, object, object)  # render key, page index, QImage or None, original page size
+
+    ahead  = 2.0    # viewport heights below the viewport that are rendered in advance
+    behind = 1.0    # viewport heights above the viewport that are kept
+
+    container   = None  # identifies the shown pages, see setPages
+    strip_width = 0
+    rotation    = 0
+    resize_mode = Image.BICUBIC
+
+    def __init__(self, scroll_area, threads = 2):
+        super(StripView, self).__init__()
+        self.setStyleSheet("background-color: rgb(0, 0, 0);")
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+        self.scroll_area = scroll_area
+        self.generation = 0     # incremented for every new set of pages, cancels the work for the pages before
+        self.names = []         # page names
+        self.layers = []        # page layers
+        self.sizes = []         # original page sizes (unrotated), None while unknown
+        self.tops = [0]         # y of every page and the total height at the end
+        self.top = -1           # index of the page at the top of the viewport
+        self.pixmaps = {}       # page index -> (render key, QPixmap), only pages near the viewport
+        self.pending = set()    # page indices being rendered for the current render key
+        self.wanted = set()     # page indices near the viewport, read by the workers
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+
+        self.measured.connect(self.onMeasured)
+        self.rendered.connect(self.onRendered)
+        scroll_area.verticalScrollBar().valueChanged.connect(self.onScrolled)
+
+    def renderKey(self):
+        """ pixmaps rendered for another key need to be rendered again """
+        return (self.generation, self.strip_width, self.rotation, self.resize_mode)
+
+    def setPages(self, container, pages):
+        """
+        show pages (list of (name, image layer) pairs), container identifies them (e.g. the chapter)
+        Showing the same container again keeps the layout and the rendered pages
+        """
+        if container is not None and container == self.container and [layer for name, layer in pages] == self.layers:
+            return
+
+        self.generation += 1
+        self.container = container
+        self.names = [name for name, layer in pages]
+        self.layers = [layer for name, layer in pages]
+        self.sizes = [None] * len(self.layers)
+        self.top = -1
+        self.pixmaps = {}
+        self.pending = set()
+        self.wanted = set()
+
+        self.relayout(False)
+        if self.layers:
+            self.pool.start(MeasureTask(self, self.generation, self.layers))
+
+    def clear(self):
+        self.setPages(None, [])
+
+    def shutdown(self):
+        self.clear()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def fit(self, width, rotation, resize_mode):
+        """ lay the pages out for the strip width, rotated by rotation and scaled with resize_mode """
+        if (width, rotation, resize_mode) == (self.strip_width, self.rotation, self.resize_mode):
+            return
+
+        if rotation != self.rotation:
+            # scaled previews of other orientations would be distorted
+            self.pixmaps = {}
+        self.strip_width = max(0, width)
+        self.rotation = rotation
+        self.resize_mode = resize_mode
+        self.pending = set()
+        self.relayout()
+
+    def pageHeight(self, index):
+        return self.tops[index + 1] - self.tops[index]
+
+    def pageAt(self, y):
+        """ index of the page at y or None if there are no pages """
+        if not self.layers:
+            return None
+        return min(max(bisect_right(self.tops, y) - 1, 0), len(self.layers) - 1)
+
+    def pageRect(self, index):
+        return QRect(0, self.tops[index], self.strip_width, self.pageHeight(index))
+
+    def relayout(self, anchored = True):
+        """ compute the page positions, the page at the top of the viewport stays in place if anchored """
+        bar = self.scroll_area.verticalScrollBar()
+        anchor = self.pageAt(bar.value()) if anchored and self.scroll_area.widget() is self else None
+        if anchor is not None:
+            fraction = (bar.value() - self.tops[anchor]) / max(1, self.pageHeight(anchor))
+
+        known = next((size for size in self.sizes if size), None)
+        tops = [0]
+        for size in self.sizes:
+            known = size or known
+            height = stripHeight(known, self.strip_width, self.rotation) if known else int(self.strip_width * default_aspect)
+            tops.append(tops[-1] + height)
+        self.tops = tops
+
+        self.resize(self.strip_width, max(1, tops[-1]))
+        if anchor is not None:
+            bar.setValue(self.tops[anchor] + int(round(fraction * self.pageHeight(anchor))))
+        self.update()
+        self.schedule()
+
+    def scrollToPage(self, index):
+        """ scroll the page with index to the top of the viewport """
+        if not 0 <= index < len(self.layers):
+            return
+        bar = self.scroll_area.verticalScrollBar()
+        bar.setValue(self.tops[index])
+        # the page was chosen, the page at the top after clamping to the end of the strip isn't reported
+        self.top = self.pageAt(bar.value())
+        self.schedule()
+
+    def scrollPage(self, step):
+        """ scroll down (step 1) or up (-1) by most of a viewport height, returns False at the end of the strip """
+        bar = self.scroll_area.verticalScrollBar()
+        if (step > 0 and bar.value() >= bar.maximum()) or (step < 0 and bar.value() <= bar.minimum()):
+            return False
+        bar.setValue(bar.value() + step * int(bar.pageStep() * 0.9))
+        return True
+
+    def onScrolled(self, value):
+        if self.scroll_area.widget() is not self or not self.layers:
+            return
+
+        top = self.pageAt(value)
+        if top != self.top:
+            self.top = top
+            self.pageChanged.emit(top)
+        self.schedule()
+
+    def schedule(self):
+        """ render the pages around the viewport (visible ones first), drop the pixmaps of pages further away """
+        if not self.layers or self.strip_width <= 0 or self.scroll_area.widget() is not self:
+            return
+
+        y = self.scroll_area.verticalScrollBar().value()
+        height = max(1, self.scroll_area.viewport().height())
+        first, last = self.pageAt(y), self.pageAt(y + height - 1)
+        keep_first, keep_last = self.pageAt(y - int(self.behind * height)), self.pageAt(y + height + int(self.ahead * height))
+
+        for index in [index for index in self.pixmaps if not keep_first <= index <= keep_last]:
+            del self.pixmaps[index]
+        self.wanted = set(range(keep_first, keep_last + 1))
+
+        key = self.renderKey()
+        order = list(range(first, last + 1)) + list(range(last + 1, keep_last + 1)) + list(range(first - 1, keep_first - 1, -1))
+        for index in order:
+            entry = self.pixmaps.get(index)
+            if (entry and entry[0] == key) or index in self.pending:
+                continue
+            self.pending.add(index)
+            self.pool.start(RenderTask(self, key, index, self.layers[index]), 1 if first <= index <= last else 0)
+
+    def onMeasured(self, generation, start, sizes):
+        if generation != self.generation:
+            return
+
+        changed = False
+        for index, size in enumerate(sizes, start):
+            # sizes of decoded pages are already there
+            if size and self.sizes[index] is None:
+                self.sizes[index] = size
+                changed = True
+        if changed:
+            self.relayout()
+
+    def onRendered(self, key, index, image, size):
+        if key != self.renderKey():
+            return
+        self.pending.discard(index)
+
+        relayout = size is not None and self.sizes[index] != size
+        if relayout:
+            self.sizes[index] = size
+        if image is not None and index in self.wanted:
+            self.pixmaps[index] = (key, QPixmap.fromImage(image))
+
+        if relayout:
+            self.relayout()
+        else:
+            self.update(self.pageRect(index))
+
+        if image is not None and self.visibleRegion().boundingRect().intersects(self.pageRect(index)):
+            self.pageShown.emit(index)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), Qt.black)
+        if not self.layers:
+            return
+
+        painter.setPen(QColor(96, 96, 96))
+        for index in range(self.pageAt(event.rect().top()), self.pageAt(event.rect().bottom()) + 1):
+            entry = self.pixmaps.get(index)
+            if entry:
+                # pixmaps rendered for another width are stretched until the new ones arrive
+                painter.drawPixmap(self.pageRect(index), entry[1])
+            else:
+                painter.drawText(self.pageRect(index), Qt.AlignCenter, self.names[index])
+
+    def mouseDoubleClickEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.onDoubleClick.emit()
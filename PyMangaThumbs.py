@@ -0,0 +1,96 @@
+import io
+
+from PyQt5.QtCore import (QObject, QRunnable, QThreadPool, pyqtSignal)
+from PIL import Image
+
+from PyMangaLogger import log
+from PyMangaIndex import fileStamp
+import PyMangaLayer
+
+# edge length of the square thumbnails are fitted into
+thumbnail_size = 128
+
+def makeThumbnail(layer, size):
+    """ decode the page of the image layer reduced and encode a thumbnail fitting into size x size as JPEG """
+    image = layer.decode((size, size))
+    if image is None:
+        return None
+    image.thumbnail((size, size), Image.BILINEAR)
+
+    data = io.BytesIO()
+    image.save(data, "JPEG", quality=80)
+    return data.getvalue()
+
+class ThumbnailTask(QRunnable):
+    """ loads the thumbnail of a single page from the cache or makes it in a worker thread """
+
+    def __init__(self, thumbnailer, generation, layer):
+        super(ThumbnailTask, self).__init__()
+        self.thumbnailer = thumbnailer
+        self.generation = generation
+        self.layer = layer
+
+    def run(self):
+        # chapter isn't shown anymore
+        if self.generation != self.thumbnailer.generation:
+            return
+
+        key = list(self.layer.key)
+        size = self.thumbnailer.size
+        stamp = fileStamp(self.layer.key[0])
+        # thumbnails are stored in the library index
+        cache = PyMangaLayer.library_index
+
+        # nothing may escape the worker thread (index errors included), a made thumbnail is shown even if storing it failed
+        data = None
+        try:
+            if cache and stamp:
+                data = cache.lookupThumbnail(key, size, stamp)
+            if data is None:
+                data = makeThumbnail(self.layer, size)
+                if data is not None and cache and stamp:
+                    cache.storeThumbnail(key, size, stamp, data)
+        except Exception as ex:
+            log.warning("Thumbnail: failed for '%s': %s", self.layer.path, ex)
+
+        if data is not None:
+            self.thumbnailer.made.emit(self.generation, self.layer.key, data)
+
+class Thumbnailer(QObject):
+    """
+    Loads/makes the thumbnails of the pages of a chapter in a worker pool
+    Thumbnails are reported one by one as soon as they are ready, in page order
+    """
+    thumbnailReady = pyqtSignal(object, object) # layer key, encoded thumbnail (bytes)
+
+    # internal, emitted from the worker threads
+    made = pyqtSignal(int, object, object)
+
+    def __init__(self, size = thumbnail_size, threads = 2):
+        super(Thumbnailer, self).__init__()
+        self.size = size
+        self.generation = 0 # incremented on every request, cancels the thumbnails of the chapter before
+
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(threads)
+
+        self.made.connect(self.onMade)
+
+    def request(self, layers):
+        """ load the thumbnails of the image layers, drops all outstanding requests """
+        self.generation += 1
+        self.pool.clear()
+        for layer in layers:
+            self.pool.start(ThumbnailTask(self, self.generation, layer))
+
+    def cancel(self):
+        self.generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def onMade(self, generation, key, data):
+        if generation == self.generation:
+            self.thumbnailReady.emit(key, data)
@@ -0,0 +1,92 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+from PyMangaLogger import log
+
+# the stages of a page turn, in pipeline order
+STAGES = ["page turn", "archive open", "member read", "decode", "convert", "preprocess", "rotate", "resize", "ImageQt", "pixmap set"]
+
+# upper bounds (ms) of the histogram buckets, the last bucket takes everything above
+histogram_bounds = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+class StageTimings(object):
+    """
+    Rolling window of the durations of the last window measurements per stage
+    Recorded from the GUI thread and the worker threads
+    """
+    window = 256
+
+    def __init__(self, window = 256):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {} # stage -> deque of durations in seconds
+
+    def record(self, stage, seconds):
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+        log.debug("Timing: %s took %.2f ms", stage, seconds * 1000)
+
+    @contextmanager
+    def measure(self, stage):
+        """ context manager recording the time spent in its block for stage """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def snapshot(self):
+        """
+        returns stage -> summary dict (count, mean/median/p95/max in ms, histogram counts per histogram_bounds bucket)
+        for all stages that have samples, in STAGES order
+        """
+        with self.lock:
+            samples = dict((stage, list(values)) for stage, values in self.samples.items())
+
+        order = STAGES + sorted(stage for stage in samples if stage not in STAGES)
+        summary = {}
+        for stage in order:
+            values = samples.get(stage)
+            if not values:
+                continue
+            ordered = sorted(value * 1000 for value in values)
+            histogram = [0] * (len(histogram_bounds) + 1)
+            for value in ordered:
+                bucket = 0
+                while bucket < len(histogram_bounds) and value > histogram_bounds[bucket]:
+                    bucket += 1
+                histogram[bucket] += 1
+            summary[stage] = {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered),
+                "median": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+                "histogram": histogram
+            }
+        return summary
+
+# process wide timings of the page turn stages
+timings = StageTimings()
+
+def timed(stage):
+    """ with timed("decode"): ... records the duration of the block in timings """
+    return timings.measure(stage)
+
+# wall clock times (time.time(), comparable with the launching process) the startup milestones were reached
+startup_marks = {}
+
+def markStartup(milestone):
+    """ remember when milestone was reached first """
+    if milestone not in startup_marks:
+        startup_marks[milestone] = time.time()
+        log.info("Startup: %s", milestone)
@@ -0,0 +1,73 @@
+from PyQt5.QtWidgets import (QDialog, QPlainTextEdit, QPushButton, QVBoxLayout, QHBoxLayout)
+from PyQt5.QtCore import (QTimer)
+from PyQt5.QtGui import (QFontDatabase)
+
+from PyMangaTiming import timings, histogram_bounds
+
+class TimingDialog(QDialog):
+    """
+    Debug dialog showing the rolling timings of the page turn stages (see PyMangaTiming)
+    Refreshes itself every second while it is visible
+    """
+    bar_width = 30
+
+    def __init__(self, parent = None):
+        super(TimingDialog, self).__init__(parent)
+        self.setWindowTitle("Page turn timings")
+        self.resize(720, 560)
+
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+
+        clear = QPushButton("Clear", self)
+        clear.clicked.connect(self.clearTimings)
+        close = QPushButton("Close", self)
+        close.clicked.connect(self.close)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(clear)
+        buttons.addWidget(close)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.text)
+        layout.addLayout(buttons)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start()
+        super(TimingDialog, self).showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super(TimingDialog, self).hideEvent(event)
+
+    def clearTimings(self):
+        timings.clear()
+        self.refresh()
+
+    def refresh(self):
+        summary = timings.snapshot()
+        if not summary:
+            self.text.setPlainText("No page turns measured yet")
+            return
+
+        labels = ["<=%d" % bound for bound in histogram_bounds] + [">%d" % histogram_bounds[-1]]
+        lines = ["%-13s %6s %9s %9s %9s %9s" % ("stage", "count", "mean ms", "median", "p95", "max")]
+        for stage, stats in summary.items():
+            lines.append("%-13s %6d %9.2f %9.2f %9.2f %9.2f" % (stage, stats["count"], stats["mean"], stats["median"], stats["p95"], stats["max"]))
+
+        for stage, stats in summary.items():
+            lines.append("")
+            lines.append("%s (ms)" % stage)
+            most = max(stats["histogram"])
+            for label, count in zip(labels, stats["histogram"]):
+                if count:
+                    lines.append("  %6s %-*s %d" % (label, self.bar_width, "#" * max(1, count * self.bar_width // most), count))
+
+        self.text.setPlainText("\n".join(lines))
@@ -0,0 +1,54 @@
+"""
+Benchmark of the image decoders (see PyMangaDecoders)
+Measures which decoder is fastest per image format on this machine (the reader never runs it itself):
+a synthetic page per format is decoded with every available decoder (PIL and, if installed,
+libjpeg-turbo through PyTurboJPEG) at full size and fitted into the decode size
+Prints the median ms per format and decoder and the resulting decoder order
+With --save, the resulting order is stored where the reader picks it up (manga_decoders.json next to the
+manga settings file), without it the reader keeps its shipped default decoder order
+
+Usage: python benchmark_decoders.py [--resolution WxH] [--size WxH] [--runs N] [--output file.json] [--save manga_decoders.json]
+Results are written as JSON
+"""
+import sys, json, time, argparse, platform
+
+from PyMangaDecoders import benchmarkDecoders, decoderVersions, saveBenchmark
+
+def parseSize(text):
+    return tuple(int(value) for value in text.lower().split("x"))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the image decoders")
+    parser.add_argument("--resolution", default="1400x2000", help="page resolution (WxH)")
+    parser.add_argument("--size", default="1280x1024", help="decode size limit like the reader window (WxH)")
+    parser.add_argument("--runs", type=int, default=5, help="decodes per format and decoder")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--save", metavar="FILE", help="store the decoder order for the reader (its manga_decoders.json)")
+    args = parser.parse_args(argv[1:])
+
+    results = benchmarkDecoders(parseSize(args.resolution), parseSize(args.size), args.runs)
+    output = json.dumps({
+        "config": {
+            "resolution": args.resolution,
+            "size": args.size,
+            "runs": args.runs,
+            "versions": decoderVersions(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time()
+        },
+        "median_ms": results,
+        "order": dict((format, sorted(timings, key=timings.get)) for format, timings in results.items())
+    }, indent=2)
+
+    if args.save:
+        saveBenchmark(args.save, results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for the PIL.Image -> QPixmap conversion
+Compares ImageQt with the previous implementation (BGRX/BGRA export, ARGB32/Indexed8 formats)
+for the image modes "1", "L", "P", "RGB" and "RGBA"
+
+Usage: python benchmark_imageqt.py [width] [height] [repetitions]
+Runs without a display (offscreen Qt platform)
+"""
+import os, sys, time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PIL import Image
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication
+
+from ImageQt import ImageQt, rgb, toQPixmap
+
+class LegacyImageQt(QImage):
+    """ the conversion as it was before: swizzled export and no explicit bytes per line """
+    def __init__(self, im):
+        data = None
+        colortable = None
+
+        if im.mode == "1":
+            format = QImage.Format_Mono
+        elif im.mode == "L":
+            format = QImage.Format_Indexed8
+            colortable = [rgb(i, i, i) for i in range(256)]
+        elif im.mode == "P":
+            format = QImage.Format_Indexed8
+            palette = im.getpalette()
+            colortable = [rgb(*palette[i:i+3]) for i in range(0, len(palette), 3)]
+        elif im.mode == "RGB":
+            data = im.tobytes("raw", "BGRX")
+            format = QImage.Format_RGB32
+        elif im.mode == "RGBA":
+            data = im.tobytes("raw", "BGRA")
+            format = QImage.Format_ARGB32
+        else:
+            raise ValueError("unsupported image mode %r" % im.mode)
+
+        self.__data = data or im.tobytes()
+        QImage.__init__(self, self.__data, im.size[0], im.size[1], format)
+
+        if colortable:
+            self.setColorTable(colortable)
+
+def legacyToQPixmap(im):
+    cached = LegacyImageQt(im)
+    return QPixmap.fromImage(cached)
+
+def testImage(mode, size):
+    """ a non-uniform test page (gradient with some noise) in the given mode """
+    image = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (image, image.transpose(Image.FLIP_TOP_BOTTOM), Image.effect_noise(size, 64)))
+    if mode == "P":
+        return image.convert("P", palette=Image.ADAPTIVE)
+    return image.convert(mode)
+
+def measure(convert, image, repetitions):
+    """ returns the best and the mean time in ms """
+    times = []
+    for i in range(repetitions):
+        start = time.perf_counter()
+        pixmap = convert(image)
+        times.append(time.perf_counter() - start)
+        assert not pixmap.isNull()
+    return min(times) * 1000, sum(times) / len(times) * 1000
+
+def main(argv):
+    width = int(argv[1]) if len(argv) > 1 else 1400
+    height = int(argv[2]) if len(argv) > 2 else 2000
+    repetitions = int(argv[3]) if len(argv) > 3 else 20
+
+    app = QApplication(argv[:1])
+
+    print("Converting %dx%d images, %d repetitions (best/mean ms)" % (width, height, repetitions))
+    print("%-6s %-20s %-20s %s" % ("mode", "legacy", "ImageQt", "speedup"))
+    for mode in ["1", "L", "P", "RGB", "RGBA"]:
+        image = testImage(mode, (width, height))
+        legacy = measure(legacyToQPixmap, image, repetitions)
+        current = measure(toQPixmap, image, repetitions)
+        print("%-6s %7.2f / %-10.2f %7.2f / %-10.2f %.2fx" % (mode, legacy[0], legacy[1], current[0], current[1], legacy[1] / current[1]))
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,280 @@
+"""
+Benchmark for the Layer loading pipeline (listing, Zip/Rar access, decoding, ImageQt conversion)
+Generates synthetic libraries in a temp directory:
+    dir      chapters as directories with image files
+    cbz      flat .cbz with all pages
+    nested   .cbz with a .zip per chapter (zip-in-zip)
+    cbr      .cbr with all pages (only if the rar and unrar executables are available)
+with mixed PNG/JPEG/GIF pages at several resolutions and measures per library
+listing latency, per-page decode/convert time, peak memory and throughput
+for sequential reading and random access
+Every library is measured in a subprocess of its own, so the peak RSS belongs to that library alone
+
+Usage: python benchmark_layer.py [--pages N] [--resolutions WxH,...] [--output file.json]
+Runs without a display (offscreen Qt platform), results are written as JSON
+"""
+import os, sys, io, time, json, random, shutil, zipfile, argparse, platform, tempfile, tracemalloc, subprocess
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PIL import Image
+from PyQt5.QtWidgets import QApplication
+
+import PyMangaLayer
+from PyMangaLayer import Layer, isImage, setupUnrar, which
+from PyMangaSequence import PageSequence
+from ImageQt import toQPixmap
+
+image_formats = [("jpg", "JPEG"), ("png", "PNG"), ("gif", "GIF")]
+
+def testPage(number, size):
+    """ a non-uniform test page (gradients, noise and some structure) """
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 32 + number % 32)
+    return Image.merge("RGB", (gradient, gradient.transpose(Image.FLIP_LEFT_RIGHT), noise))
+
+def encodePage(number, size):
+    """ returns (name, bytes) of page number, cycling through the image formats """
+    extension, format = image_formats[number % len(image_formats)]
+    image = testPage(number, size)
+    if format == "GIF":
+        image = image.convert("P", palette=Image.ADAPTIVE)
+    data = io.BytesIO()
+    image.save(data, format)
+    return "%03d.%s" % (number, extension), data.getvalue()
+
+def makePages(count, resolutions):
+    """ [(name, bytes)] for count pages, the resolutions are used in turn """
+    return [encodePage(i, resolutions[i % len(resolutions)]) for i in range(count)]
+
+def chapters(pages, per_chapter):
+    for i in range(0, len(pages), per_chapter):
+        yield "Chapter %d" % (i // per_chapter + 1), pages[i:i + per_chapter]
+
+def makeDirLibrary(root, pages, per_chapter):
+    series = os.path.join(root, "dir")
+    for chapter, content in chapters(pages, per_chapter):
+        os.makedirs(os.path.join(series, chapter))
+        for name, data in content:
+            with open(os.path.join(series, chapter, name), "wb") as f:
+                f.write(data)
+    return series
+
+def makeCbzLibrary(root, pages, per_chapter):
+    series = os.path.join(root, "cbz.cbz")
+    with zipfile.ZipFile(series, "w", zipfile.ZIP_STORED) as archive:
+        for chapter, content in chapters(pages, per_chapter):
+            for name, data in content:
+                archive.writestr(chapter + "/" + name, data)
+    return series
+
+def makeNestedLibrary(root, pages, per_chapter):
+    series = os.path.join(root, "nested.cbz")
+    with zipfile.ZipFile(series, "w", zipfile.ZIP_STORED) as archive:
+        for chapter, content in chapters(pages, per_chapter):
+            inner = io.BytesIO()
+            with zipfile.ZipFile(inner, "w", zipfile.ZIP_DEFLATED) as chapter_archive:
+                for name, data in content:
+                    chapter_archive.writestr(name, data)
+            archive.writestr(chapter + ".zip", inner.getvalue())
+    return series
+
+def makeCbrLibrary(root, pages, per_chapter):
+    """ needs the rar executable, returns None if it isn't available """
+    rar = which("rar")
+    if not rar:
+        return None
+
+    source = makeDirLibrary(os.path.join(root, "cbr-source"), pages, per_chapter)
+    series = os.path.join(root, "cbr.cbr")
+    subprocess.run([rar, "a", "-r", "-m0", "-idq", "-ep1", series, source + os.sep + "*"], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return series
+
+library_makers = [("dir", makeDirLibrary), ("cbz", makeCbzLibrary), ("nested", makeNestedLibrary), ("cbr", makeCbrLibrary)]
+
+def resetCaches():
+    """ cold start: no decoded pages, no open archives, no extracted rar pages, no listing index """
+    PyMangaLayer.page_cache.clear()
+    PyMangaLayer.archive_pool.clear()
+    PyMangaLayer.rar_cache.cleanup()
+    if PyMangaLayer.library_index:
+        PyMangaLayer.library_index.close()
+        PyMangaLayer.library_index = None
+
+def stats(times):
+    """ summary of a list of durations in seconds, in ms """
+    if not times:
+        return None
+    ordered = sorted(times)
+    return {
+        "count": len(times),
+        "mean_ms": sum(times) / len(times) * 1000,
+        "median_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000
+    }
+
+def maxRss():
+    """ peak resident set size of the process in MB (None where the resource module is missing) """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+def measureListing(series):
+    """ time to list all containers of the series (cold), returns the page paths and the stats """
+    resetCaches()
+    sequence = PageSequence(Layer(series), depth = 4)
+
+    times = []
+    containers = [()]
+    pages = []
+    while containers:
+        path = containers.pop(0)
+        start = time.perf_counter()
+        listing = sequence.children(path)
+        times.append(time.perf_counter() - start)
+        for name in listing.names:
+            if isImage(name):
+                pages.append(path + (name,))
+            elif len(path) + 1 < sequence.depth:
+                containers.append(path + (name,))
+
+    return sequence, pages, stats(times)
+
+def measureReading(sequence, pages, size, order):
+    """
+    open (decode) and convert the pages in order (indices into pages), size limits the decoded size (None for full size)
+    returns decode/convert stats, throughput and peak memory
+    """
+    decode_times = []
+    convert_times = []
+    pixels = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for idx in order:
+        layer = sequence.layer(pages[idx])
+
+        begin = time.perf_counter()
+        image = layer.open(size)
+        decode_times.append(time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        pixmap = toQPixmap(image)
+        convert_times.append(time.perf_counter() - begin)
+
+        pixels += image.size[0] * image.size[1]
+        del image, pixmap
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "decode": stats(decode_times),
+        "convert": stats(convert_times),
+        "pages_per_s": len(order) / total if total else None,
+        "megapixels_per_s": pixels / total / 1e6 if total else None,
+        "peak_python_heap_mb": peak / 1024 / 1024
+    }
+
+def benchmarkLibrary(name, series, size, seed):
+    sequence, pages, listing = measureListing(series)
+    result = {"pages": len(pages), "listing": listing}
+
+    resetCaches()
+    result["sequential"] = measureReading(sequence, pages, size, list(range(len(pages))))
+
+    order = list(range(len(pages)))
+    random.Random(seed).shuffle(order)
+    resetCaches()
+    result["random"] = measureReading(sequence, pages, size, order)
+
+    result["peak_rss_mb"] = maxRss()
+    return result
+
+def measureLibrary(name, series, args):
+    """ run benchmarkLibrary for series in a fresh interpreter (see --measure), returns its result """
+    command = [sys.executable, os.path.abspath(__file__), "--measure", series, "--size", args.size,
+               "--seed", str(args.seed), "--unrar", args.unrar]
+    process = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        return {"failed": "measuring exited with %d" % process.returncode}
+    return json.loads(process.stdout)
+
+def parseResolutions(text):
+    return [tuple(int(v) for v in resolution.split("x")) for resolution in text.split(",")]
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the Layer loading pipeline on synthetic libraries")
+    parser.add_argument("--pages", type=int, default=60, help="pages per library")
+    parser.add_argument("--per-chapter", type=int, default=20, help="pages per chapter")
+    parser.add_argument("--resolutions", default="800x1200,1400x2000,2400x3600", help="page resolutions, used in turn")
+    parser.add_argument("--size", default="1280x1024", help="decode size limit like the reader window (WxH) or 'full'")
+    parser.add_argument("--libraries", default=",".join(name for name, maker in library_makers), help="libraries to benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random access order")
+    parser.add_argument("--unrar", default="unrar", help="unrar executable for the cbr library")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--measure", metavar="SERIES", help=argparse.SUPPRESS) # internal: measure one library, see measureLibrary
+    args = parser.parse_args(argv[1:])
+
+    app = QApplication(argv[:1])
+    setupUnrar(args.unrar)
+
+    size = None if args.size == "full" else parseResolutions(args.size)[0]
+    if args.measure:
+        print(json.dumps(benchmarkLibrary(os.path.basename(args.measure), args.measure, size, args.seed)))
+        return
+    resolutions = parseResolutions(args.resolutions)
+    wanted = args.libraries.split(",")
+
+    root = tempfile.mkdtemp(prefix="pymanga-bench-")
+    try:
+        start = time.perf_counter()
+        pages = makePages(args.pages, resolutions)
+        generation = time.perf_counter() - start
+
+        results = {
+            "config": {
+                "pages": args.pages,
+                "per_chapter": args.per_chapter,
+                "resolutions": ["%dx%d" % resolution for resolution in resolutions],
+                "decode_size": args.size,
+                "seed": args.seed,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": time.time()
+            },
+            "generation_s": generation,
+            "libraries": {}
+        }
+
+        for name, maker in library_makers:
+            if name not in wanted:
+                continue
+            if name == "cbr" and not PyMangaLayer.isRARactive():
+                results["libraries"][name] = {"skipped": "unrar not available"}
+                continue
+
+            series = maker(root, pages, args.per_chapter)
+            if series is None:
+                results["libraries"][name] = {"skipped": "rar not available"}
+                continue
+
+            results["libraries"][name] = measureLibrary(name, series, args)
+    finally:
+        resetCaches()
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,106 @@
+"""
+Startup time measurement of the reader (time-to-first-pixel)
+Launches PyMangaReader.pyw --startup-timing repeatedly on the offscreen Qt platform with a private configuration
+(temp HOME/XDG_CONFIG_HOME) and a synthetic library, and collects the startup milestones the reader prints
+(see markStartup), in ms after launching the process:
+    imports      all modules imported
+    window       main window constructed
+    first paint  window painted for the first time
+    cached page  the snapshot of the page of the last session was shown with the first paint
+    first page   the last read page was decoded and shown
+    exit         the process is gone again (includes saving the settings)
+The first launch is cold (no library index, no snapshot), the following ones are warm
+first_pixel is the cached page if there was one and the first page otherwise
+
+Usage: python benchmark_startup.py [--runs N] [--pages N] [--output file.json]
+Needs a platform where QSettings follows HOME/XDG_CONFIG_HOME (Linux)
+"""
+import os, sys, time, json, shutil, argparse, platform, tempfile, subprocess
+
+root_dir = os.path.dirname(os.path.abspath(__file__))
+
+def launch(env):
+    """ start the reader once, returns the milestones in ms after the launch (or the error) """
+    start = time.time()
+    try:
+        process = subprocess.run([sys.executable, os.path.join(root_dir, "PyMangaReader.pyw"), "--startup-timing"],
+                                 cwd=root_dir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=120)
+    except subprocess.TimeoutExpired:
+        return {"error": "no page shown within 120 s"}
+    end = time.time()
+
+    marks = None
+    for line in process.stdout.decode(errors="replace").splitlines():
+        if line.startswith("{"):
+            marks = json.loads(line)
+    if marks is None:
+        return {"error": "no startup milestones printed (exit code %d)" % process.returncode}
+
+    result = dict((milestone, (at - start) * 1000) for milestone, at in marks.items())
+    result["exit"] = (end - start) * 1000
+    result["first_pixel"] = result.get("cached page", result.get("first page"))
+    return result
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else None
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Measure the time until the reader shows the first page")
+    parser.add_argument("--runs", type=int, default=5, help="launches, the first one is cold")
+    parser.add_argument("--pages", type=int, default=40, help="pages of the synthetic manga")
+    parser.add_argument("--resolution", default="1400x2000", help="page resolution (WxH)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args(argv[1:])
+
+    home = tempfile.mkdtemp(prefix="pymanga-startup-")
+    try:
+        # private configuration, set before anything touches QSettings
+        env = dict(os.environ, HOME=home, XDG_CONFIG_HOME=os.path.join(home, ".config"), XDG_RUNTIME_DIR=home, QT_QPA_PLATFORM="offscreen")
+        os.environ.update(env)
+
+        from PyQt5.QtCore import QSettings
+        from benchmark_layer import makePages, makeDirLibrary, parseResolutions
+        from PyMangaSettings import COMPANY, APPLICATION
+        from PyMangaSettingsDialog import MANGA_DIRS, MANGA_SETTINGS_PATH, UNRAR_EXE
+
+        library = os.path.join(home, "library")
+        manga = os.path.basename(makeDirLibrary(library, makePages(args.pages, parseResolutions(args.resolution)), 20))
+
+        settings = QSettings(COMPANY, APPLICATION)
+        settings.setValue("settings", {MANGA_DIRS: [library], MANGA_SETTINGS_PATH: os.path.join(home, "manga_settings.ini"), UNRAR_EXE: "unrar"})
+        settings.setValue("last_manga", manga)
+        settings.sync()
+
+        runs = []
+        for run in range(args.runs):
+            result = launch(env)
+            result["cold"] = run == 0
+            runs.append(result)
+
+        warm = [run for run in runs if not run["cold"] and "error" not in run]
+        milestones = ["imports", "window", "first paint", "cached page", "first page", "first_pixel", "exit"]
+        results = {
+            "config": {
+                "runs": args.runs,
+                "pages": args.pages,
+                "resolution": args.resolution,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": time.time()
+            },
+            "runs": runs,
+            "warm_median_ms": dict((milestone, median([run[milestone] for run in warm if milestone in run])) for milestone in milestones)
+        }
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main(sys.argv)